@@ -0,0 +1,196 @@
+"""
+Class-wide analytics kept up to date as answers arrive.
+
+Every recorded answer updates three summary tables in data/analytics.db
+(SQLite, WAL mode) in one transaction:
+
+    leaderboard       points per (subject, user)
+    chapter_accuracy  attempts/correct per (subject, chapter, topic)
+    question_stats    attempts/correct/latency per (subject, question)
+
+Queries read those tables directly through their indexes and never touch
+the per-user progress files. To build the tables for an existing install:
+
+    python analytics.py rebuild
+"""
+import argparse
+import os
+import sqlite3
+import threading
+
+import progress_log
+import question_bank
+import storage
+
+ANALYTICS_DB = './data/analytics.db'
+
+
+class Analytics:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS leaderboard (
+            subject  TEXT NOT NULL,
+            username TEXT NOT NULL,
+            points   INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (subject, username)
+        );
+        CREATE INDEX IF NOT EXISTS leaderboard_by_points ON leaderboard (subject, points DESC);
+        CREATE TABLE IF NOT EXISTS chapter_accuracy (
+            subject  TEXT NOT NULL,
+            chapter  TEXT NOT NULL,
+            topic    TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            correct  INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (subject, chapter, topic)
+        );
+        CREATE TABLE IF NOT EXISTS question_stats (
+            subject     TEXT NOT NULL,
+            question_id TEXT NOT NULL,
+            attempts    INTEGER NOT NULL DEFAULT 0,
+            correct     INTEGER NOT NULL DEFAULT 0,
+            latency_sum REAL NOT NULL DEFAULT 0,
+            latency_n   INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (subject, question_id)
+        );
+    """
+
+    def __init__(self, path=ANALYTICS_DB):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _apply(self, conn, username, subject, question_id, correct, latency, points, chapter=None, topic=None):
+        if chapter is None:
+            chapter, topic = self._question_chapter(subject, question_id)
+        chapter = chapter or ""
+        topic = topic or ""
+        correct = 1 if correct else 0
+
+        if points:
+            conn.execute(
+                "INSERT INTO leaderboard (subject, username, points) VALUES (?, ?, ?) "
+                "ON CONFLICT (subject, username) DO UPDATE SET points = points + excluded.points",
+                (subject, username, points))
+        conn.execute(
+            "INSERT INTO chapter_accuracy (subject, chapter, topic, attempts, correct) VALUES (?, ?, ?, 1, ?) "
+            "ON CONFLICT (subject, chapter, topic) DO UPDATE SET "
+            "attempts = attempts + 1, correct = correct + excluded.correct",
+            (subject, chapter, topic, correct))
+        conn.execute(
+            "INSERT INTO question_stats (subject, question_id, attempts, correct, latency_sum, latency_n) "
+            "VALUES (?, ?, 1, ?, ?, ?) "
+            "ON CONFLICT (subject, question_id) DO UPDATE SET "
+            "attempts = attempts + 1, correct = correct + excluded.correct, "
+            "latency_sum = latency_sum + excluded.latency_sum, latency_n = latency_n + excluded.latency_n",
+            (subject, question_id, correct, latency or 0, 1 if latency is not None else 0))
+
+    @staticmethod
+    def _question_chapter(subject, question_id):
+        """
+        (chapter, topic) for attempts recorded without them. Only whole-file
+        banks are consulted; a sharded subject would have to load every chapter.
+        """
+        path = question_bank.subject_file(subject)
+        if os.path.isdir(path):
+            return "", ""
+        bank = question_bank.get_bank(path)
+        question = bank.by_id.get(question_id) if bank is not None else None
+        if question is None:
+            return "", ""
+        return question.get("chapter", ""), question.get("topic", "")
+
+    def record_answer(self, username, subject, question_id, correct, latency=None, chapter=None, topic=None,
+                      review=False, **_):
+        """
+        Fold one answer into every summary table. Reviews count towards
+        accuracy but, like the score, earn no leaderboard points. Extra
+        attempt fields are ignored.
+        """
+        points = 1 if correct and not review else 0
+        with self._connect() as conn:
+            self._apply(conn, username, subject, question_id, correct, latency, points,
+                        chapter=chapter, topic=topic)
+
+    def leaderboard(self, subject, limit=10):
+        rows = self._connect().execute(
+            "SELECT username, points FROM leaderboard WHERE subject = ? ORDER BY points DESC, username LIMIT ?",
+            (subject, limit))
+        return [{"Student": username, "Points": points} for username, points in rows]
+
+    def chapter_accuracy(self, subject):
+        rows = self._connect().execute(
+            "SELECT chapter, topic, attempts, correct FROM chapter_accuracy WHERE subject = ? ORDER BY chapter, topic",
+            (subject,))
+        return [{"Chapter": chapter, "Topic": topic, "Attempts": attempts,
+                 "Accuracy %": round(100 * correct / attempts, 1) if attempts else 0.0}
+                for chapter, topic, attempts, correct in rows]
+
+    def hardest_questions(self, subject, limit=10, min_attempts=3):
+        rows = self._connect().execute(
+            "SELECT question_id, attempts, correct, latency_sum, latency_n FROM question_stats "
+            "WHERE subject = ? AND attempts >= ? "
+            "ORDER BY CAST(correct AS REAL) / attempts, attempts DESC LIMIT ?",
+            (subject, min_attempts, limit))
+        return [{"Question": qid, "Attempts": attempts,
+                 "Difficulty": round(1 - correct / attempts, 2),
+                 "Avg seconds": round(latency_sum / latency_n, 1) if latency_n else None}
+                for qid, attempts, correct, latency_sum, latency_n in rows]
+
+    def rebuild(self, store, progress_store):
+        """
+        Recompute every table from the user store and each user's attempt
+        history. Offline maintenance only; the app never calls this. Progress
+        from before the attempt log existed has no per-attempt records and is
+        not counted.
+        """
+        users = store.load_users()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM leaderboard")
+            conn.execute("DELETE FROM chapter_accuracy")
+            conn.execute("DELETE FROM question_stats")
+            for user in users:
+                for subject, points in user.get("scores", {}).items():
+                    conn.execute("INSERT INTO leaderboard (subject, username, points) VALUES (?, ?, ?)",
+                                 (subject, user["username"], points))
+                for event in progress_store.iter_history(user["username"]):
+                    self._apply(conn, user["username"], event["subject"], event["question_id"],
+                                event["correct"], event.get("latency"), 0,
+                                chapter=event.get("chapter"), topic=event.get("topic"))
+        return len(users)
+
+
+_analytics = None
+_analytics_lock = threading.Lock()
+
+
+def get_analytics():
+    """Return the process-wide Analytics instance."""
+    global _analytics
+    with _analytics_lock:
+        if _analytics is None:
+            _analytics = Analytics(os.environ.get("AVANI_ANALYTICS_DB", ANALYTICS_DB))
+        return _analytics
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Avani Academy analytics tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("rebuild", help="Rebuild the summary tables from scores and attempt history")
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        count = get_analytics().rebuild(storage.get_user_store(), progress_log)
+        print(f"Rebuilt analytics for {count} users")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,207 +1,124 @@
 import streamlit as st
-import base64
 import time
-import json
 import os
 import random
-import pandas as pd
+import secrets
 import streamlit.components.v1 as components
+import question_bank
+import storage
+import audio_assets
+import image_assets
+import analytics
+import bulk_import
+import search_index
+from selector import QuestionSelector
+import worksheets
+import instrumentation
+from instrumentation import timed
+from data_context import DataContext
+import session_plan
+import write_behind
 
 # Enable wide mode
 st.set_page_config(page_title="Avani Academy", 
                    page_icon='./data/logo.ico', 
                    layout="wide")
 
-# Function to play audio using base64 encoding
-def autoplay_audio(file_path: str):
-    with open(file_path, "rb") as f:
-        data = f.read()
-        b64 = base64.b64encode(data).decode()
-        md = f"""
-            <audio autoplay="true">
-            <source src="data:audio/mp3;base64,{b64}" type="audio/mp3">
-            </audio>
-            """
-        st.markdown(md, unsafe_allow_html=True)
-
 # Paths to data directories
-USERS_FILE = './data/users.json'
-SUBJECTS_DIR = './data/subjects/'
+SUBJECTS_DIR = question_bank.SUBJECTS_DIR
 USER_PROGRESS_DIR = './data/user_progress/'
 AVATAR_FILE = './data/avatar.png'
 
-os.makedirs(SUBJECTS_DIR, exist_ok=True)
-os.makedirs(USER_PROGRESS_DIR, exist_ok=True)
+# Avatars shown per page on the login screen
+LOGIN_PAGE_SIZE = 8
+SIDEBAR_LOGO_WIDTH = 240
+
+# Questions per practice session
+SESSION_QUESTIONS = 20
+
+# Most matches listed in the tutor's question search
+SEARCH_RESULTS = 50
+
+# Used when data/subjects/manifest.json is missing
+DEFAULT_SUBJECTS = ["English", "Maths", "Science", "Social Studies", "Computer Science", "Hindi", "Kannada"]
+
+@st.cache_resource
+def init_process():
+    """One-time setup for this server process; later reruns get the cached result."""
+    os.makedirs(SUBJECTS_DIR, exist_ok=True)
+    os.makedirs(USER_PROGRESS_DIR, exist_ok=True)
+    storage.get_user_store()
+    analytics.get_analytics()
+    # Parse (or load the compiled) banks now so the first student doesn't wait for it.
+    # Sharded subjects are skipped: they are read a chapter at a time, on demand.
+    for subject in question_bank.subject_names():
+        path = question_bank.subject_file(subject)
+        if not os.path.isdir(path):
+            question_bank.get_bank(path)
+    return True
+
+init_process()
+
+# Users and scores live in users.json or SQLite (see storage.py) and are read
+# through a fresh DataContext each rerun, so each is loaded at most once;
+# writes are queued at the end of the rerun and written behind (write_behind.py)
+data = DataContext(storage.get_user_store(), analytics=analytics.get_analytics(),
+                   writer=write_behind.get_writer(storage.get_user_store(), analytics.get_analytics()))
 
 def load_users():
-    if not os.path.exists(USERS_FILE):
-        return []
-    with open(USERS_FILE, 'r') as file:
-        return json.load(file)["users"]
+    return data.users()
 
 def save_users(users):
-    with open(USERS_FILE, 'w') as file:
-        json.dump({"users": users}, file, indent=4)
+    data.save_users(users)
 
-def user_is_tutor(username):
-    """Return True if the user has role == 'tutor' in users.json."""
-    users = load_users()
-    for u in users:
-        if u["username"] == username:
-            return u.get("role", "").lower() == "tutor"
-    return False
-
-def generate_worksheet_html(questions, subject):
-    """
-    Builds an HTML snippet with up to 20 questions of two different types:
-    1. Multiple choice (10 questions) - options displayed horizontally
-    2. Fill in the blanks (10 questions)
-    This is for printing on paper (does not show correct answers).
-    """
-    # Separate questions into the two types
-    total_questions = len(questions)
-    mc_count = min(10, total_questions)
-    blank_count = min(10, max(0, total_questions - mc_count))
-    
-    mc_questions = questions[:mc_count]
-    blank_questions = questions[mc_count:mc_count + blank_count]
-    
-    html_parts = []
-    html_parts.append(f"<h2 class='worksheet-title'>Worksheet - {subject}</h2>")
-    html_parts.append("<p>Please complete all questions in each section.</p>")
-    
-    # Section 1: Multiple Choice with horizontal options
-    if mc_questions:
-        html_parts.append("<hr><h3>Section 1: Choose the correct option</h3>")
-        for i, q in enumerate(mc_questions, start=1):
-            question_text = q.get("question", "")
-            options = q.get("options", [])
-            chapter = q.get("chapter", "Unknown Chapter")
-            html_parts.append(f"<div class='question'><p><b>Q{i}. ({chapter})</b> {question_text}</p>")
-            
-            if isinstance(options, list) and len(options) > 0:
-                # Create horizontal options with flexbox
-                html_parts.append("<div class='options-container' style='display: flex; flex-wrap: wrap; gap: 15px; margin-top: 10px; margin-bottom: 15px;'>")
-                for idx, opt in enumerate(options):
-                    option_letter = chr(97 + idx)  # Convert 0, 1, 2, 3 to a, b, c, d
-                    html_parts.append(f"<div class='option'><span style='font-weight: bold;'>{option_letter})</span> {opt}</div>")
-                html_parts.append("</div>")
-            
-            html_parts.append("</div>")
-    
-    # Section 2: Fill in the blanks
-    if blank_questions:
-        html_parts.append("<hr><h3>Section 2: Fill in the blanks</h3>")
-        for i, q in enumerate(blank_questions, start=1):
-            question_text = q.get("question", "")
-            chapter = q.get("chapter", "Unknown Chapter")
-            html_parts.append(f"<div class='question'><p><b>Q{i}. ({chapter})</b> {question_text}</p>")
-            html_parts.append("<p>Answer: ____________________</p>")
-            html_parts.append("</div>")
-    
-    # Add some basic styling for print
-    html_parts.append("""
-    <style>
-        @media print {
-            body { 
-                font-family: Arial, sans-serif; 
-            }
-            /* Only apply page break for h2 that are NOT the first one */
-            h2:not(:first-of-type) { 
-                page-break-before: always; 
-            }
-            .worksheet-title {
-                page-break-before: avoid !important; /* Specifically prevent page break before title */
-                page-break-after: avoid;
-                margin-top: 0;
-            }
-            .question { 
-                margin-bottom: 20px; 
-            }
-            hr { 
-                border: 0.5px solid #ddd; 
-            }
-            .options-container { 
-                break-inside: avoid; /* Prevents option lists from breaking across pages */
-            }
-            .option {
-                min-width: 120px; /* Ensures options have a minimum width */
-            }
-        }
-    </style>
-    """)
-    
-    html_parts.append("<hr>")
-    return "\n".join(html_parts)
+def get_user(username):
+    return data.get_user(username)
 
-def generate_worksheet_html2(questions, subject):
-    """
-    Builds an HTML snippet with up to 20 questions (and their options).
-    This is for printing on paper (does not show correct answers).
-    """
-    html_parts = []
-    html_parts.append(f"<h2>Worksheet - {subject}</h2>")
-    html_parts.append("<p>Please answer the following questions:</p>")
-
-    for i, q in enumerate(questions, start=1):
-        question_text = q.get("question", "")
-        options = q.get("options", [])
-        chapter = q.get("chapter", "Unknown Chapter")
-
-        html_parts.append(f"<hr><h3>Q{i}. ({chapter})</h3>")
-        html_parts.append(f"<p><b>{question_text}</b></p>")
-        if isinstance(options, list) and len(options) > 0:
-            html_parts.append("<ul>")
-            for opt in options:
-                html_parts.append(f"<li>{opt}</li>")
-            html_parts.append("</ul>")
-        else:
-            # If there's no options list, you could do a blank line
-            html_parts.append("<p>__________</p>")
+def increment_score(username, subject):
+    data.increment_score(username, subject)
 
-    html_parts.append("<hr>")
-    return "\n".join(html_parts)
+def user_is_tutor(username):
+    """Return True if the user has role == 'tutor' in the user store."""
+    return data.is_tutor(username)
 
 def show_left_rail():
-    logo_path = './data/logo.png'
-    st.sidebar.image(logo_path, caption="Avani Academy", use_container_width=True)
+    image_assets.image(image_assets.LOGO_FILE, SIDEBAR_LOGO_WIDTH, caption="Avani Academy", container=st.sidebar)
     if "logged_in_user" in st.session_state:
         user = st.session_state["logged_in_user"]
         st.sidebar.subheader(f"User: {user}")
-        
-        avatar_path = f"./data/{user}.png"
-        avatar_path = avatar_path.lower()
-        if os.path.exists(avatar_path):
-            st.sidebar.image(avatar_path, caption="User Avatar", width=80)
+
+        image_assets.image(image_assets.avatar_file(user), image_assets.AVATAR_RAIL_WIDTH,
+                           caption="User Avatar", container=st.sidebar)
 
         if "selected_subject" in st.session_state:
             subject = st.session_state["selected_subject"]
-            users = load_users()
-            user_data = next((u for u in users if u['username'] == user), None)
+            user_data = get_user(user)
             if user_data:
                 score = user_data.get("scores", {}).get(subject, 0)
                 st.sidebar.markdown(f"**{subject} Score: {score}**")
 
-def load_subject_questions(subject):
-    subject_file_name = subject.lower().replace(" ", "_")
-    subject_file = os.path.join(SUBJECTS_DIR, f"{subject_file_name}.json")
-    if not os.path.exists(subject_file):
+@timed("load_subject_bank")
+def load_subject_bank(subject, chapters=None):
+    subject_file = question_bank.subject_file(subject)
+    # Parsed banks are shared by every session in this process; don't mutate them.
+    # For sharded (bulk imported) subjects only the given chapters are read.
+    bank = question_bank.get_bank(subject_file, chapters=chapters)
+    if bank is None:
         st.error(f"Expected file '{subject_file}' not found.")
-        return []
-    with open(subject_file, 'r') as file:
-        return json.load(file)["questions"]
+    return bank
+
+def load_subject_questions(subject):
+    bank = load_subject_bank(subject)
+    return bank.questions if bank is not None else []
 
+# Progress is an append-only attempt log per user, see progress_log.py
 def load_user_progress(username):
-    user_file = os.path.join(USER_PROGRESS_DIR, f"{username}.json")
-    if not os.path.exists(user_file):
-        return {}
-    with open(user_file, 'r') as file:
-        return json.load(file)
+    return data.progress(username)
 
-def save_user_progress(username, progress):
-    user_file = os.path.join(USER_PROGRESS_DIR, f"{username}.json")
-    with open(user_file, 'w') as file:
-        json.dump(progress, file, indent=4)
+def record_attempt(username, subject, question_id, correct, latency=None, box=None, due=None,
+                   chapter=None, topic=None, review=False):
+    data.record_attempt(username, subject, question_id, correct, latency=latency, box=box, due=due,
+                        chapter=chapter, topic=topic, review=review)
 
 
 def login_screen():
@@ -209,7 +126,7 @@ def login_screen():
     col1, col2 = st.columns([2, 8])
 
     with col1:
-        st.image(logo_path, width=150)
+        image_assets.image(logo_path, image_assets.LOGO_WIDTH)
 
     with col2:
         st.title("Avani Academy")
@@ -218,24 +135,38 @@ def login_screen():
     users = load_users()
 
     if users:
-        selected_user = None
-        total_columns = 2 + len(users) + 2
-        cols = st.columns(total_columns)
+        # Only one page of avatars is sent, however long the roster is
+        page_count = (len(users) + LOGIN_PAGE_SIZE - 1) // LOGIN_PAGE_SIZE
+        page = min(st.session_state.get("login_page", 0), page_count - 1)
+        page_users = users[page * LOGIN_PAGE_SIZE:(page + 1) * LOGIN_PAGE_SIZE]
 
-        for idx, user in enumerate(users):
-            avatar_path = f"./data/{user['username']}.png"
-            avatar_path = avatar_path.lower()
+        total_columns = 2 + len(page_users) + 2
+        cols = st.columns(total_columns)
 
+        for idx, user in enumerate(page_users):
             # The user avatars start from the 3rd column (idx+2)
             with cols[idx + 2]:  # Shift index by 2 to skip the first 2 padding columns
-                if os.path.exists(avatar_path):
-                    # Display the avatar image with a button for login
-                    st.image(avatar_path, caption=user['username'], width=150)
+                # Display the avatar image with a button for login
+                if image_assets.image(image_assets.avatar_file(user['username']),
+                                      image_assets.AVATAR_LOGIN_WIDTH, caption=user['username']):
                     if st.button(f"{user['username']}", key=user['username']):
                         st.session_state["logged_in_user"] = user['username']
                         st.success(f"Welcome back, {user['username']}!")
                         st.rerun()
 
+        if page_count > 1:
+            prev_col, label_col, next_col = st.columns([1, 2, 1])
+            with prev_col:
+                if st.button("Previous", disabled=page == 0):
+                    st.session_state["login_page"] = page - 1
+                    st.rerun()
+            with label_col:
+                st.write(f"Page {page + 1} of {page_count}")
+            with next_col:
+                if st.button("Next", disabled=page >= page_count - 1):
+                    st.session_state["login_page"] = page + 1
+                    st.rerun()
+
 
 def subject_selection_screen():
     show_left_rail()
@@ -251,65 +182,53 @@ def subject_selection_screen():
         st.error("User data not found.")
         return
 
-    subjects = ["English", "Maths", "Science", "Social Studies", "Computer Science", "Hindi", "Kannada"]
+    subjects = question_bank.subject_names() or DEFAULT_SUBJECTS
     selected_subject = st.selectbox("Choose a subject", options=subjects)
 
     if user_is_tutor(user):
         st.subheader("Tutor Mode - Generate Worksheet")
+        layout = st.selectbox("Layout", options=list(worksheets.LAYOUTS), key="worksheet_layout")
+        seed = st.text_input("Seed (leave empty for a new worksheet)", key="worksheet_seed")
         if st.button("Create Worksheet"):
-            all_questions = load_subject_questions(selected_subject)
-            # Pick up to 20 questions randomly
-            chosen_20 = random.sample(all_questions, min(20, len(all_questions)))
-            # Build HTML and save it in session_state
-            st.session_state["worksheet_html"] = generate_worksheet_html(chosen_20, selected_subject)
+            # A seeded spec fully determines the worksheet, so it can be reprinted from its ID
+            spec = worksheets.WorksheetSpec(selected_subject, layout=layout, seed=seed.strip() or secrets.token_hex(4))
+            st.session_state["worksheet_spec"] = spec
             st.session_state["show_worksheet"] = True
+
+        worksheet_id = st.text_input("Open a worksheet by ID", key="worksheet_id")
+        if st.button("Open Worksheet", disabled=not worksheet_id):
+            spec = worksheets.spec_for_id(worksheet_id)
+            if spec is None:
+                st.error(f"No worksheet with ID '{worksheet_id}'.")
+            else:
+                st.session_state["worksheet_spec"] = spec
+                st.session_state["show_worksheet"] = True
+
+        question_search_panel(selected_subject, layout)
         
         # If we have generated a worksheet, display it + print button
         if st.session_state.get("show_worksheet"):
+            spec = st.session_state["worksheet_spec"]
+            st.caption(f"Worksheet ID: {spec.id} ({spec.subject}, seed {spec.seed})")
             
             component_height = st.slider("Adjust preview height", min_value=600, max_value=2000, value=800, step=100)
-            
-            components.html(
-                f"""
-                <html>
-                <head>
-                    <style>
-                        body {{
-                            font-family: Arial, sans-serif;
-                            padding: 20px;
-                        }}
-                        .print-button {{
-                            position: sticky;
-                            bottom: 20px;
-                            background-color: #4CAF50;
-                            color: white;
-                            padding: 10px 20px;
-                            border: none;
-                            border-radius: 4px;
-                            cursor: pointer;
-                            font-size: 16px;
-                            margin-top: 20px;
-                            z-index: 1000;
-                        }}
-                        .print-button:hover {{
-                            background-color: #45a049;
-                        }}
-                        @media print {{
-                            .print-button {{
-                                display: none;
-                            }}
-                        }}
-                    </style>
-                </head>
-                <body>
-                    {st.session_state["worksheet_html"]}
-                    <button class="print-button" onclick="window.print()">Print Worksheet</button>
-                </body>
-                </html>
-                """,
-                height=component_height,
-                scrolling=True
-            )
+
+            # Cached in memory per spec, so slider moves don't re-render or touch the disk cache
+            with instrumentation.timer("render_preview_page"):
+                pages = worksheets.render_preview(spec)
+            if pages is not None:
+                preview, answer_key = pages
+                components.html(preview, height=component_height, scrolling=True)
+                st.download_button("Download Answer Key", answer_key,
+                                   file_name=f"answer_key_{spec.id}.html", mime="text/html")
+
+        class_analytics_panel(selected_subject)
+        class_worksheets_panel(users, subjects)
+        question_import_panel()
+
+        # Hidden unless the page is opened with ?diagnostics=1
+        if st.query_params.get("diagnostics") == "1":
+            diagnostics_panel()
         
         if st.button("Logout", key="logout_tutor"):
             st.session_state.clear()
@@ -317,89 +236,232 @@ def subject_selection_screen():
     else:
         # If user is a student -> show the old "Start Learning" flow
         st.subheader("Student Mode")
+        subject_path = question_bank.subject_file(selected_subject)
+        chapters = []
+        if os.path.isdir(subject_path):
+            # Bulk imported subjects are split by chapter; only the chosen ones get loaded
+            chapters = st.multiselect("Chapters (leave empty for all)",
+                                      options=question_bank.chapter_names(subject_path))
         if st.button("Start Learning"):
             st.session_state["selected_subject"] = selected_subject
+            st.session_state["selected_chapters"] = tuple(chapters) or None
             st.session_state["question_attempts"] = 0  # Reset attempt counter
             st.session_state["current_question"] = None
+            # Pick the whole session now so moving between questions costs nothing
+            st.session_state["session_plan"] = plan_session(user, selected_subject)
             st.rerun()
 
         scores = user_data.get("scores", {})
 
-        # Create a DataFrame for the table
-        score_data = {
-            "Subject": subjects,
-            "Points": [scores.get(subject, 0) for subject in subjects]
-        }
-        score_df = pd.DataFrame(score_data)
+        # A plain markdown table; no need to pull in pandas for a few rows
+        score_rows = "\n".join(f"| {subject} | {scores.get(subject, 0)} |" for subject in subjects)
         st.sidebar.subheader("Your Scores:")
-        st.sidebar.table(score_df)
+        st.sidebar.markdown("| Subject | Points |\n| --- | ---: |\n" + score_rows)
 
         if st.sidebar.button("Logout", key="logout_student"):
             st.session_state.clear()
             st.rerun()
 
-# Function to get the next question
-def get_next_question(username, subject):
-    questions = load_subject_questions(subject)
-    if not questions:
-        st.error("No questions available for this subject.")
-        return None
-
-    # Load user progress
-    progress = load_user_progress(username)
-    attempted_questions = progress.get(subject, {}).get("attempted", {})
-
-    # Separate questions into new and incorrect questions
-    new_questions = [q for q in questions if q['id'] not in attempted_questions]
-    incorrect_questions = [q for q in questions if q['id'] in attempted_questions and not attempted_questions[q['id']]]
-
-    # Prioritize incorrectly answered questions
-    if incorrect_questions:
-        question = random.choice(incorrect_questions)
-        st.session_state["old_question"] = False  # Incorrect questions can update the score
-    elif new_questions:
-        question = random.choice(new_questions)
-        st.session_state["old_question"] = False  # New question, so it can update the score
-    else:
-        st.success("You've completed all questions for this subject!")
-        return None
-
-    return question
+def question_search_panel(subject, layout):
+    """Tutor tool to find questions by keyword and build a worksheet from hand-picked ones."""
+    with st.expander("Find questions"):
+        path = question_bank.subject_file(subject)
+        # Bulk imported subjects are only read (and indexed) once the tutor searches them
+        sharded = os.path.isdir(path)
+        if sharded:
+            chapters = question_bank.chapter_names(path)
+        else:
+            bank = load_subject_bank(subject)
+            if bank is None:
+                return
+            chapters = sorted(bank.by_chapter)
+        query = st.text_input("Search", key="question_query", placeholder="e.g. identify the verb")
+        chapter = st.selectbox("Chapter", options=["All chapters"] + chapters, key="question_chapter")
+        matches = []
+        if not sharded or query.strip() or chapter != "All chapters":
+            matches = search_index.get_index().search(
+                query, subjects=[subject], chapter=None if chapter == "All chapters" else chapter,
+                limit=SEARCH_RESULTS)
+
+        # Keep earlier picks selectable even when the current query no longer matches them
+        picks_key = f"picked_questions_{subject}"
+        picked = st.session_state.get(picks_key, [])
+        labels = st.session_state.setdefault(f"picked_labels_{subject}", {})
+        labels.update((q['id'], q.get('question', '')) for _, q in matches)
+        options = picked + [q['id'] for _, q in matches if q['id'] not in picked]
+        picked = st.multiselect(f"Pick questions ({len(matches)} shown)", options=options, key=picks_key,
+                                format_func=lambda qid: f"{qid}: {labels[qid]}" if qid in labels else qid)
+        # Only the labels still on screen are worth keeping
+        shown = set(options)
+        for qid in [qid for qid in labels if qid not in shown]:
+            del labels[qid]
+
+        if st.button("Create Worksheet from Picks", disabled=not picked):
+            st.session_state["worksheet_spec"] = worksheets.WorksheetSpec(subject, layout=layout,
+                                                                          question_ids=picked)
+            st.session_state["show_worksheet"] = True
 
-def get_next_question_fancy(username, subject):
-    questions = load_subject_questions(subject)
-    if not questions:
-        st.error("No questions available for this subject.")
+        if st.button("Check for near-duplicate questions"):
+            report = search_index.get_index().near_duplicates()
+            st.dataframe([{"Similarity": round(similarity, 2), "Question": f"{subject_a} / {id_a}",
+                           "Similar to": f"{subject_b} / {id_b}"}
+                          for similarity, (subject_a, id_a), (subject_b, id_b) in report],
+                         use_container_width=True, hide_index=True)
+
+def question_import_panel():
+    """Tutor upload of a CSV or JSONL question bank, imported row by row (see bulk_import.py)."""
+    with st.expander("Import questions"):
+        uploaded = st.file_uploader("CSV or JSONL file", type=["csv", "jsonl", "ndjson"])
+        subject = st.text_input("Subject name (replaces that subject's questions)", key="import_subject")
+        dry_run = st.checkbox("Only validate", key="import_dry_run")
+        if st.button("Import", disabled=not (uploaded and subject.strip())):
+            try:
+                with st.spinner("Importing questions..."):
+                    result = bulk_import.import_upload(uploaded, subject.strip(), dry_run=dry_run)
+            except ValueError as e:
+                st.error(str(e))
+                return
+            summary = (f"{result.imported} questions in {result.chapters} chapters, "
+                       f"{result.duplicates} duplicate ids skipped, {result.invalid} invalid rows")
+            if result.imported:
+                st.success(summary)
+            else:
+                st.warning(summary)
+            if result.errors:
+                st.code("\n".join(result.errors))
+
+def class_analytics_panel(subject):
+    """Class-wide view for tutors, read from the incrementally maintained summary tables."""
+    st.subheader(f"Tutor Mode - Class Analytics ({subject})")
+    stats = analytics.get_analytics()
+    col1, col2 = st.columns(2)
+    with col1:
+        st.caption("Leaderboard")
+        st.dataframe(stats.leaderboard(subject), use_container_width=True, hide_index=True)
+    with col2:
+        st.caption("Hardest questions")
+        st.dataframe(stats.hardest_questions(subject), use_container_width=True, hide_index=True)
+    st.caption("Accuracy by chapter and topic")
+    st.dataframe(stats.chapter_accuracy(subject), use_container_width=True, hide_index=True)
+
+def class_worksheets_panel(users, subjects):
+    """Tutor tool to print a distinct worksheet for every student, rendered in the background."""
+    st.subheader("Tutor Mode - Class Worksheets")
+    students = [u['username'] for u in users if u.get('role', 'student').lower() != 'tutor']
+    roster = st.multiselect("Students", options=students, default=students)
+    batch_subjects = st.multiselect("Subjects", options=subjects, key="batch_subjects")
+
+    chapters = set()
+    for subject in batch_subjects:
+        path = question_bank.subject_file(subject)
+        if os.path.exists(path):
+            chapters.update(question_bank.chapter_names(path))
+    chosen_chapters = st.multiselect("Chapters (leave empty for all)", options=sorted(chapters))
+    seed = st.text_input("Seed", value="1")
+
+    if st.button("Generate Class Worksheets", disabled=not (roster and batch_subjects)):
+        st.session_state["batch_future"] = worksheets.submit_in_background(
+            roster, batch_subjects, chapters=chosen_chapters or None, seed=seed)
+
+    future = st.session_state.get("batch_future")
+    if future is None:
+        return
+    if not future.done():
+        wait_for_class_worksheets()
+        return
+    try:
+        result = future.result()
+    except Exception as e:
+        st.error(f"Could not generate worksheets: {e}")
+        return
+    st.success(f"{result.count} worksheets ready in {result.seconds:.1f}s")
+    st.download_button("Download Worksheets", result.worksheets_html,
+                       file_name="worksheets.html", mime="text/html")
+    st.download_button("Download Answer Key", result.answer_key_html,
+                       file_name="answer_key.html", mime="text/html")
+
+@st.fragment(run_every=1)
+def wait_for_class_worksheets():
+    if st.session_state["batch_future"].done():
+        st.rerun()
+    st.info("Generating worksheets...")
+
+METRICS_DIR = './data/metrics/'
+
+def diagnostics_panel():
+    """Tutor-only view of the hot-path timings collected by instrumentation.py."""
+    with st.expander("Diagnostics", expanded=True):
+        enabled = st.toggle("Collect timings", value=instrumentation.ENABLED)
+        if enabled != instrumentation.ENABLED:
+            instrumentation.set_enabled(enabled)
+        st.caption(f"Reruns in this session: {st.session_state.get('rerun_count', 0)}")
+
+        rows, counters = instrumentation.summary()
+        if rows:
+            st.dataframe(rows, use_container_width=True)
+        if counters:
+            st.write(counters)
+        st.caption("Most recent calls")
+        st.dataframe(instrumentation.recent(50), use_container_width=True)
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            if st.button("Export JSONL"):
+                path = instrumentation.export(os.path.join(METRICS_DIR, "metrics.jsonl"))
+                st.success(f"Appended to {path}")
+        with col2:
+            if st.button("Export Prometheus"):
+                path = instrumentation.export(os.path.join(METRICS_DIR, "metrics.prom"), fmt="prometheus")
+                st.success(f"Wrote {path}")
+        with col3:
+            if st.button("Reset"):
+                instrumentation.reset()
+                st.rerun()
+
+# Question selection policy: "leitner", "priority" or "fancy" (see selector.py)
+QUESTION_POLICY = os.environ.get("AVANI_QUESTION_POLICY", "leitner")
+
+def get_selector(username, subject):
+    """Return this session's QuestionSelector for the subject, building it on first use."""
+    bank = load_subject_bank(subject, st.session_state.get("selected_chapters"))
+    if bank is None:
         return None
-
-    # Load user progress
-    progress = load_user_progress(username)
-    attempted_questions = progress.get(subject, {}).get("attempted", {})
-
-    # Separate questions into new, incorrect, and already correctly answered
-    new_questions = [q for q in questions if q['id'] not in attempted_questions]
-    incorrect_questions = [q for q in questions if q['id'] in attempted_questions and not attempted_questions[q['id']]]
-    old_questions = [q for q in questions if q['id'] in attempted_questions and attempted_questions[q['id']]]
-
-    # 30% chance to show an already correctly answered question
-    random_number = random.randint(1, 10)
-
-    # Decide whether to show a new question, incorrect question, or an old correct question
-    if incorrect_questions and (random.random() < 0.8):  # Prioritize incorrectly answered questions
-        # Occasionally revisit an incorrect question
-        question = random.choice(incorrect_questions)
-        st.session_state["old_question"] = False  # Incorrect questions can update the score
-    elif random_number <= 3 and old_questions:  # 30% chance to show an old question
-        question = random.choice(old_questions)
-        st.session_state["old_question"] = True  # Mark it as an old, correctly answered question
-    elif new_questions:
-        question = random.choice(new_questions)
-        st.session_state["old_question"] = False  # New question, so it can update the score
-    else:
-        st.success("You've completed all questions for this subject!")
+    selectors = st.session_state.setdefault("selectors", {})
+    cached = selectors.get((username, subject))
+    # Rebuild if the subject file was edited since the selector was made
+    if cached is None or cached[0] is not bank:
+        progress = load_user_progress(username)
+        # The selector refers to questions by position in the shared bank, not by copies
+        cached = (bank, QuestionSelector(bank.ids, progress.get(subject), policy=QUESTION_POLICY,
+                                         index=bank.index))
+        selectors[(username, subject)] = cached
+    return cached[1]
+
+@timed("plan_session")
+def plan_session(username, subject):
+    """Choose the rest of this session's questions in one pass; None if the subject has none."""
+    selector = get_selector(username, subject)
+    if selector is None:
         return None
+    bank = load_subject_bank(subject, st.session_state.get("selected_chapters"))
+    remaining = SESSION_QUESTIONS - st.session_state.get("question_count", 0)
+    st.session_state["plan_number"] = st.session_state.get("plan_number", 0) + 1
+    return session_plan.make_plan(subject, bank, selector, remaining)
 
-    return question
+def save_answer(user, subject, question, correct, latency, review=False):
+    """
+    Score and record one answer and move the selector on. Reviews of
+    questions already answered correctly are recorded but don't score again.
+    """
+    if correct and not review:
+        increment_score(user, subject)
+    box = due = None
+    selector = get_selector(user, subject)
+    if selector is not None:
+        box, due = selector.record(question['id'], correct)
+    # Record every attempt so incorrect answers survive the session too
+    record_attempt(user, subject, question['id'], correct, latency=latency, box=box, due=due,
+                   chapter=question.get('chapter'), topic=question.get('topic'), review=review)
 
 
 def question_screen():
@@ -410,10 +472,11 @@ def question_screen():
     if 'question_count' not in st.session_state:
         st.session_state['question_count'] = 0  # Start with 0 questions
 
-    st.sidebar.markdown(f"**Questions answered: {st.session_state['question_count']} / 20**")
+    st.sidebar.markdown(f"**Questions answered: {st.session_state['question_count']} / {SESSION_QUESTIONS}**")
+    audio_assets.preload()
 
-    if st.session_state['question_count'] >= 20:
-        st.error("Session is over. You have answered 20 questions. Logging out...")
+    if st.session_state['question_count'] >= SESSION_QUESTIONS:
+        st.error(f"Session is over. You have answered {SESSION_QUESTIONS} questions. Logging out...")
         st.session_state.clear()
         st.rerun()
 
@@ -424,6 +487,7 @@ def question_screen():
         if st.button("Home"):
             st.session_state.pop("selected_subject", None)
             st.session_state.pop("current_question", None)
+            st.session_state.pop("session_plan", None)
             st.session_state.pop("question_attempts", None)
             st.session_state.pop("question_completed", None)
             st.rerun()
@@ -436,11 +500,6 @@ def question_screen():
     # Define a list of color options for question background
     color_options = ['#FFDDC1', '#C1E1C1', '#C1D3FF', '#FFCCCC', '#FFEB99']
 
-    # Load user progress
-    progress = load_user_progress(user)
-    subject_progress = progress.get(subject, {"attempted": {}})
-    attempted_questions = subject_progress["attempted"]
-
     # Initialize some flags
     if 'button_disabled' not in st.session_state:
         st.session_state['button_disabled'] = False
@@ -449,23 +508,36 @@ def question_screen():
     if 'correct_answer' not in st.session_state:
         st.session_state['correct_answer'] = False
 
-    # Get or set current question
-    if st.session_state.get("current_question") is None:
-        question = get_next_question(user, subject)
-        if question is None:
+    # The session's questions were planned at "Start Learning"; plan again if
+    # there is no plan yet or the bank was reloaded since
+    bank = load_subject_bank(subject, st.session_state.get("selected_chapters"))
+    plan = st.session_state.get("session_plan")
+    if plan is None or not plan.matches(bank) or plan.subject != subject:
+        plan = st.session_state["session_plan"] = plan_session(user, subject)
+        st.session_state["current_question"] = None
+
+    if session_plan.PREFETCH and plan is not None:
+        prefetched_session(user, subject, bank, plan)
+        return
+
+    # Session state only holds the question's position in the bank, which every session shares
+    current = st.session_state.get("current_question")
+    if current is None:
+        current = plan.current() if plan is not None else None
+        if current is None:
             st.write("No more questions available for this subject.")
             st.write("Session is over. You have completed all available questions.")
             st.session_state.clear()
             st.rerun()
 
-        st.session_state["current_question"] = question
+        st.session_state["current_question"] = current
         st.session_state["question_attempts"] = 0
         st.session_state['button_disabled'] = False
         st.session_state['question_answered'] = False
         st.session_state['correct_answer'] = False
         st.session_state["bg_color"] = random.choice(color_options)
-    else:
-        question = st.session_state["current_question"]
+        st.session_state["question_shown_at"] = time.time()
+    question = bank.questions[current]
 
     # Apply a random background color to the question area
     bg_color = st.session_state.get("bg_color", "#FFFFFF")
@@ -491,7 +563,7 @@ def question_screen():
         """,
         unsafe_allow_html=True
     )
-    options = question['options']
+    options = plan.options(bank)
 
     # Inject CSS to make the radio label and options larger
     st.markdown(
@@ -517,53 +589,83 @@ def question_screen():
     if st.session_state['question_answered']:
         if st.session_state['correct_answer']:
             st.success("Bravo! That is correct.")
-            autoplay_audio('./sounds/correct_answer.mp3')
+            audio_assets.play("correct")
         else:
             st.error("That is not correct. Let's come back to this later.")
-            autoplay_audio('./sounds/incorrect_answer.mp3')
+            audio_assets.play("incorrect")
 
-        time.sleep(3)
-
-        # Update score only if correct
-        if st.session_state['correct_answer']:
-            users = load_users()
-            for u in users:
-                if u['username'] == user:
-                    u.setdefault('scores', {})
-                    u['scores'][subject] = u['scores'].get(subject, 0) + 1
-                    break
-            save_users(users)
-
-            # Update user progress
-            attempted_questions[question['id']] = True
-            progress[subject] = {"attempted": attempted_questions}
-            save_user_progress(user, progress)
-        else:
-            attempted_questions[question['id']] = False
-
-        # Move to the next question
-        st.session_state["current_question"] = None
-        st.session_state["question_attempts"] = 0
-        st.session_state['question_count'] += 1
-        st.session_state['question_answered'] = False
-        st.rerun()
+        # The result is already saved; the fragment below moves on after the
+        # feedback delay without holding the script thread
+        feedback_timer()
     else:
         if st.button("Submit Answer"):
             # Check if the selected answer is correct
-            if user_choice == question['answer']:
-                st.session_state['correct_answer'] = True
-            else:
-                st.session_state['correct_answer'] = False
+            correct = user_choice == question['answer']
+            st.session_state['correct_answer'] = correct
+
+            shown_at = st.session_state.get("question_shown_at")
+            latency = round(time.time() - shown_at, 3) if shown_at else None
+
+            # Persist straight away so nothing depends on the feedback screen
+            save_answer(user, subject, question, correct, latency, review=plan.is_review())
 
             # Set the flag and rerun to display the result
             st.session_state['question_answered'] = True
             st.session_state['button_disabled'] = True
+            st.session_state['answered_at'] = time.time()
             st.rerun()
 
+def prefetched_session(user, subject, bank, plan):
+    """
+    Ask the planned questions through the browser-side player, which moves
+    on without waiting for the server. Answers it reports are checked and
+    recorded here, once each.
+    """
+    value = session_plan.player(plan, bank, key=f"session_player_{st.session_state.get('plan_number', 0)}")
+    for k, choice, latency in (value or {}).get("answers", []):
+        if k != plan.cursor:
+            continue  # recorded on an earlier rerun
+        question = bank.questions[plan.current()]
+        save_answer(user, subject, question, choice == question['answer'], latency, review=plan.is_review())
+        plan.advance()
+        st.session_state['question_count'] += 1
+    if plan.done:
+        st.success("That's the end of this session. Pick a subject to keep going!")
+
+def advance_to_next_question():
+    plan = st.session_state.get("session_plan")
+    if plan is not None:
+        plan.advance()
+    st.session_state["current_question"] = None
+    st.session_state["question_attempts"] = 0
+    st.session_state['question_count'] += 1
+    st.session_state['question_answered'] = False
+
+# Seconds the correct/incorrect message stays up before the next question
+FEEDBACK_SECONDS = 3
+
+@st.fragment(run_every=FEEDBACK_SECONDS)
+def feedback_timer():
+    """Re-runs on its own every FEEDBACK_SECONDS and advances once the delay has passed."""
+    if not st.session_state.get('question_answered'):
+        return
+    answered_at = st.session_state.get('answered_at', 0)
+    if st.button("Next Question") or time.time() - answered_at >= FEEDBACK_SECONDS:
+        advance_to_next_question()
+        st.rerun()
+
 # Main app flow
-if "logged_in_user" not in st.session_state:
-    login_screen()
-elif "selected_subject" not in st.session_state:
-    subject_selection_screen()
-else:
-    question_screen()
+st.session_state["rerun_count"] = st.session_state.get("rerun_count", 0) + 1
+instrumentation.count("rerun")
+
+with instrumentation.timer("rerun"):
+    try:
+        if "logged_in_user" not in st.session_state:
+            login_screen()
+        elif "selected_subject" not in st.session_state:
+            subject_selection_screen()
+        else:
+            question_screen()
+    finally:
+        # st.rerun() and st.stop() raise, so this also runs before those reruns
+        data.flush()
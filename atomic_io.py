@@ -0,0 +1,138 @@
+"""
+Crash- and concurrency-safe helpers for the JSON data files.
+
+Several Streamlit server processes may share one data directory, so:
+
+* Writes never modify a file in place. atomic_write_json writes a temp file
+  in the same directory, fsyncs it and os.replace()s it over the target, so a
+  reader sees either the old or the new file, never a truncated one.
+* Writers serialise on an fcntl advisory lock held on a sidecar
+  "<path>.lock" file. Readers never take the lock and never block.
+* update_json does a locked read-modify-write (e.g. a score increment), and
+  write_json_if_unchanged gives optimistic concurrency for callers that
+  read, think, then write: it refuses to overwrite a file that changed since
+  it was read.
+
+On platforms without fcntl the lock only covers threads in this process.
+"""
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager, nullcontext
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class VersionConflict(Exception):
+    """The file changed on disk between reading it and trying to write it back."""
+
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+def _thread_lock(path):
+    with _thread_locks_guard:
+        return _thread_locks.setdefault(os.path.abspath(path), threading.RLock())
+
+
+@contextmanager
+def locked(path, shared=False):
+    """Hold the advisory lock for `path` (exclusive unless shared=True)."""
+    if fcntl is None:
+        with _thread_lock(path):
+            yield
+        return
+    fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)  # closing the descriptor releases the lock
+
+
+def file_version(path):
+    """Opaque token that changes whenever the file is replaced or rewritten; None if missing."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _fsync_dir(directory):
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_write_json(path, data, commit=None, **dump_kwargs):
+    """
+    Write JSON to `path` via temp file + fsync + os.replace. Does not lock.
+    `commit`, if given, is a context manager factory entered around just the
+    os.replace, the moment readers start seeing the new contents.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            json.dump(data, file, **dump_kwargs)
+            file.flush()
+            os.fsync(file.fileno())
+        with commit() if commit is not None else nullcontext():
+            os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    _fsync_dir(directory)
+
+
+def read_json(path, default=None):
+    """Lock-free read; returns `default` if the file doesn't exist."""
+    data, _ = read_json_versioned(path, default)
+    return data
+
+
+def read_json_versioned(path, default=None):
+    """Return (data, version) for use with write_json_if_unchanged."""
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            version = os.fstat(file.fileno())
+            return json.load(file), (version.st_ino, version.st_mtime_ns, version.st_size)
+    except FileNotFoundError:
+        return default, None
+
+
+def write_json(path, data, **dump_kwargs):
+    with locked(path):
+        atomic_write_json(path, data, **dump_kwargs)
+
+
+def write_json_if_unchanged(path, data, version, **dump_kwargs):
+    """Replace the file only if it is still at `version`; raises VersionConflict otherwise."""
+    with locked(path):
+        if file_version(path) != version:
+            raise VersionConflict(path)
+        atomic_write_json(path, data, **dump_kwargs)
+
+
+def update_json(path, update, default=None, commit=None, **dump_kwargs):
+    """
+    Locked read-modify-write: `update(data)` gets the current contents and
+    returns the new contents, which are written atomically. Returns them.
+    `commit` is passed on to atomic_write_json.
+    """
+    with locked(path):
+        data = read_json(path, default)
+        data = update(data)
+        atomic_write_json(path, data, commit=commit, **dump_kwargs)
+        return data
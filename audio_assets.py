@@ -0,0 +1,61 @@
+"""
+Answer feedback sounds.
+
+With static serving enabled (see .streamlit/config.toml) the <audio> tag only
+carries a URL under app/static/, so the browser downloads each clip once and
+reuses it from its cache. Without static serving we fall back to an inline
+data URI, but the file is still read and base64-encoded only once per process.
+"""
+import base64
+import os
+from functools import lru_cache
+
+import streamlit as st
+
+SOUNDS_DIR = './static/sounds/'
+STATIC_URL = 'app/static/sounds/'
+
+SOUNDS = {
+    "correct": "correct_answer.mp3",
+    "incorrect": "incorrect_answer.mp3",
+}
+
+
+@lru_cache(maxsize=None)
+def _data_uri(file_name):
+    with open(os.path.join(SOUNDS_DIR, file_name), "rb") as f:
+        return "data:audio/mp3;base64," + base64.b64encode(f.read()).decode()
+
+
+def _static_serving_enabled():
+    try:
+        return bool(st.get_option("server.enableStaticServing"))
+    except Exception:
+        return False
+
+
+def sound_src(name):
+    file_name = SOUNDS[name]
+    if _static_serving_enabled():
+        return STATIC_URL + file_name
+    return _data_uri(file_name)
+
+
+def play(name):
+    """Autoplay one of the feedback sounds."""
+    st.markdown(
+        f'<audio autoplay="true"><source src="{sound_src(name)}" type="audio/mp3"></audio>',
+        unsafe_allow_html=True
+    )
+
+
+def preload():
+    """Ask the browser to fetch every sound up front, once per session."""
+    if st.session_state.get("audio_preloaded") or not _static_serving_enabled():
+        return
+    tags = "".join(
+        f'<audio preload="auto" src="{STATIC_URL + file_name}"></audio>'
+        for file_name in SOUNDS.values()
+    )
+    st.markdown(f'<div style="display:none">{tags}</div>', unsafe_allow_html=True)
+    st.session_state["audio_preloaded"] = True
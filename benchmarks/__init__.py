@@ -0,0 +1 @@
+"""Offline benchmarks for the quiz flow, run from the repository root with python -m."""
@@ -0,0 +1,282 @@
+"""
+Concurrent-student load test for the real quiz flow.
+
+    python -m benchmarks.bench_flow --students 20 --answers 10
+
+Each simulated student drives app.py through Streamlit's AppTest:
+login_screen -> subject_selection_screen -> question_screen, answering
+questions until --answers is reached. AppTest keeps Streamlit's runtime in
+a process-wide global, so students run concurrently in a pool of spawned
+worker processes, one session at a time per worker, all against a scratch
+copy of data/ so the real data is never touched. Concurrent workers share
+the data files the way several app servers would.
+
+Reports per-rerun latency (p50/p99), answers per second, how many times the
+user store and progress files were opened, and traced memory per session.
+Each worker loads the subject's bank before tracing starts, so traced memory
+is what a session adds on top of the shared bank. SQLite reads and writes
+happen in C and are not counted as file opens.
+"""
+import argparse
+import builtins
+import io
+import json
+import os
+import pickle
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import question_bank
+from benchmarks.timing import print_row, summarize
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_FILE = os.path.join(REPO_ROOT, "app.py")
+
+IO_CATEGORIES = {
+    "users": ("users.json", "avani.db"),
+    "progress": ("user_progress",),
+    "subjects": ("subjects", "compiled"),
+}
+
+
+class IOCounter:
+    """Counts open() and os.open() calls by the kind of data file touched."""
+
+    def __init__(self):
+        self.counts = {name: 0 for name in IO_CATEGORIES}
+        self._lock = threading.Lock()
+        self._open = builtins.open
+        self._os_open = os.open
+
+    def _count(self, path):
+        path = os.fspath(path) if not isinstance(path, int) else ""
+        for name, needles in IO_CATEGORIES.items():
+            if any(needle in path for needle in needles):
+                with self._lock:
+                    self.counts[name] += 1
+                return
+
+    def __enter__(self):
+        def counting_open(file, *args, **kwargs):
+            self._count(file)
+            return self._open(file, *args, **kwargs)
+
+        def counting_os_open(path, *args, **kwargs):
+            self._count(path)
+            return self._os_open(path, *args, **kwargs)
+
+        builtins.open = counting_open
+        os.open = counting_os_open
+        return self
+
+    def __exit__(self, *exc):
+        builtins.open = self._open
+        os.open = self._os_open
+
+
+def copy_app_data(directory):
+    """Copy what app.py reads and writes (data/, static/, .streamlit/) into a scratch directory."""
+    for name in ("data", "static", ".streamlit"):
+        source = os.path.join(REPO_ROOT, name)
+        if os.path.isdir(source):
+            shutil.copytree(source, os.path.join(directory, name))
+
+
+def prepare_workdir(directory, students):
+    """Copy the app's data into a scratch directory and add `students` synthetic users."""
+    copy_app_data(directory)
+    data = os.path.join(directory, "data")
+    users = [{"username": f"student{i:03d}", "role": "student", "scores": {}} for i in range(students)]
+    with open(os.path.join(data, "users.json"), "w") as file:
+        json.dump({"users": users}, file, indent=4)
+    for user in users:
+        # login_screen only shows users that have an avatar
+        shutil.copy(os.path.join(data, "avatar.png"), os.path.join(data, f"{user['username']}.png"))
+    return [u["username"] for u in users]
+
+
+def _button(at, label):
+    return next(b for b in at.button if b.label == label)
+
+
+class _SessionPickler(pickle.Pickler):
+    """Pickles references to the process-wide question banks as placeholders."""
+
+    def __init__(self, file, shared):
+        super().__init__(file)
+        self.shared = shared
+
+    def persistent_id(self, obj):
+        return "shared" if id(obj) in self.shared else None
+
+
+def _shared_objects():
+    shared = set()
+    for _, bank in list(question_bank._banks.values()):
+        shared.update((id(bank), id(bank.ids), id(bank.index)))
+        shared.update(id(q) for q in bank.questions)
+    return shared
+
+
+def session_state_bytes(at):
+    """
+    Approximate pickled size of what a session holds on its own. Question
+    banks are shared by every session in the process, so state pointing into
+    them counts only the reference.
+    """
+    # AppTest wraps the real SessionState; read its user-visible keys directly
+    # so a change in Streamlit's internals fails here instead of reporting 0
+    state = at.session_state._state.filtered_state
+    shared = _shared_objects()
+    total = 0
+    for key, value in state.items():
+        buffer = io.BytesIO()
+        try:
+            _SessionPickler(buffer, shared).dump(value)
+        except Exception as e:
+            raise TypeError(f"session state {key!r} can't be measured: {e}") from e
+        total += buffer.tell()
+    return total
+
+
+class StudentSession:
+    def __init__(self, username, subject, answers, correct_share, timeout, seed):
+        from streamlit.testing.v1 import AppTest
+
+        self.at = AppTest.from_file(APP_FILE, default_timeout=timeout)
+        self.username = username
+        self.subject = subject
+        self.answers = answers
+        self.correct_share = correct_share
+        self.rng = random.Random(seed)
+        self.rerun_times = []
+        self.answered = 0
+        self.errors = []
+
+    def _run(self, element=None):
+        started = time.perf_counter()
+        (element or self.at).run()
+        self.rerun_times.append(time.perf_counter() - started)
+        if self.at.exception:
+            self.errors.extend(str(e.value) for e in self.at.exception)
+            raise RuntimeError(self.errors[-1])
+
+    def play(self):
+        at = self.at
+        self._run()
+        # The login screen shows one page of students at a time
+        while not any(b.key == self.username for b in at.button):
+            self._run(_button(at, "Next").click())
+        self._run(at.button(key=self.username).click())
+        self._run(at.selectbox[0].set_value(self.subject))
+        self._run(_button(at, "Start Learning").click())
+
+        while self.answered < self.answers:
+            index = at.session_state["current_question"]
+            if index is None:
+                break
+            question = question_bank.get_bank(question_bank.subject_file(self.subject)).questions[index]
+            if self.rng.random() < self.correct_share:
+                choice = question["answer"]
+            else:
+                choice = self.rng.choice(question["options"])
+            at.radio[0].set_value(choice)
+            self._run(_button(at, "Submit Answer").click())
+            self.answered += 1
+            self._run(_button(at, "Next Question").click())
+        return self
+
+
+def _init_worker(workdir, subject):
+    """Point a spawned worker at the scratch copy and load the subject's bank once."""
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(workdir)
+    question_bank.get_bank(question_bank.subject_file(subject))
+
+
+def _play(args):
+    """Play one student's session in a worker and return its measurements."""
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    with IOCounter() as io_counter:
+        session = StudentSession(*args).play()
+    # The session is still referenced here, so its state is still traced
+    memory = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    return {
+        "rerun_times": session.rerun_times,
+        "answered": session.answered,
+        "file_opens": io_counter.counts,
+        "memory": memory,
+        "session_state": session_state_bytes(session.at),
+    }
+
+
+def run_load_test(students, answers, subject, concurrency, correct_share=0.7, timeout=30):
+    workdir = tempfile.mkdtemp(prefix="avani-bench-")
+    try:
+        usernames = prepare_workdir(workdir, students)
+        jobs = [(name, subject, answers, correct_share, timeout, i) for i, name in enumerate(usernames)]
+        # AppTest replaces a worker's __main__ with app.py, so the worker functions
+        # are sent by this module's import name even when it runs with -m
+        from benchmarks import bench_flow
+
+        # spawn rather than fork: each worker needs a Streamlit runtime of its own
+        with ProcessPoolExecutor(max_workers=concurrency, mp_context=get_context("spawn"),
+                                 initializer=bench_flow._init_worker, initargs=(workdir, subject)) as pool:
+            # Start every worker before the clock does, so spawning isn't timed
+            list(pool.map(time.sleep, [0] * concurrency))
+            started = time.perf_counter()
+            sessions = list(pool.map(bench_flow._play, jobs))
+            elapsed = time.perf_counter() - started
+
+        rerun_times = [t for s in sessions for t in s["rerun_times"]]
+        total_answers = sum(s["answered"] for s in sessions)
+        file_opens = {name: sum(s["file_opens"][name] for s in sessions) for name in IO_CATEGORIES}
+        return {
+            "students": students,
+            "concurrency": concurrency,
+            "answers": total_answers,
+            "seconds": elapsed,
+            "answers_per_sec": total_answers / elapsed if elapsed else 0.0,
+            "rerun": summarize(rerun_times),
+            "file_opens": file_opens,
+            "file_opens_per_answer": {k: v / max(1, total_answers) for k, v in file_opens.items()},
+            "memory_per_session_kb": sum(s["memory"] for s in sessions) / max(1, students) / 1024,
+            "session_state_kb": sum(s["session_state"] for s in sessions) / max(1, students) / 1024,
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent students against app.py")
+    parser.add_argument("--students", type=int, default=20)
+    parser.add_argument("--answers", type=int, default=10, help="Answers per student (at most 19)")
+    parser.add_argument("--subject", default="English")
+    parser.add_argument("--concurrency", type=int, default=8, help="Worker processes")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = run_load_test(args.students, min(args.answers, 19), args.subject, args.concurrency)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{results['students']} students ({results['concurrency']} at a time), {results['answers']} answers in {results['seconds']:.2f}s "
+          f"({results['answers_per_sec']:.1f} answers/s)")
+    print_row("rerun latency", results["rerun"])
+    for name, count in results["file_opens"].items():
+        print(f"{name + ' file opens':<40} {count:<8} ({results['file_opens_per_answer'][name]:.2f} per answer)")
+    print(f"{'memory per session':<40} {results['memory_per_session_kb']:.1f} KiB traced, "
+          f"{results['session_state_kb']:.1f} KiB session state")
+
+
+if __name__ == "__main__":
+    main()
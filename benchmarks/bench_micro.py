@@ -0,0 +1,123 @@
+"""
+Micro-benchmarks for the per-question hot paths against synthetic banks.
+
+    python -m benchmarks.bench_micro --sizes 1000 10000 100000
+
+Covers bank loading (what load_subject_questions does), next-question
+selection (get_next_question) and worksheet rendering
+(generate_worksheet_html). The "scan" rows reproduce the original
+list-comprehension selection so the selector can be compared against it.
+The memory rows show what one session holds for a subject.
+"""
+import argparse
+import gc
+import json
+import random
+import tempfile
+import tracemalloc
+
+import question_bank
+import worksheets
+from selector import QuestionSelector
+
+from benchmarks import synthetic
+from benchmarks.timing import print_row, summarize, time_calls
+
+
+def _scan_pick(questions, attempted, rng):
+    # The selection get_next_question did before the selector existed
+    new_questions = [q for q in questions if q['id'] not in attempted]
+    incorrect_questions = [q for q in questions if q['id'] in attempted and not attempted[q['id']]]
+    if incorrect_questions:
+        return rng.choice(incorrect_questions)
+    if new_questions:
+        return rng.choice(new_questions)
+    return None
+
+
+def _traced_kb(build):
+    """KB still allocated by what build() returns, while it is alive."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del kept
+    return allocated / 1024
+
+
+def bench_size(directory, size, repeat):
+    results = {}
+    path = synthetic.write_bank(directory, size)
+
+    def cold_load():
+        question_bank.clear_cache()
+        question_bank.get_bank(path)
+
+    results["bank_load_cold"] = summarize(time_calls(cold_load, max(3, repeat // 10)))
+    question_bank.get_bank(path)
+    results["bank_load_warm"] = summarize(time_calls(lambda: question_bank.get_bank(path), repeat))
+
+    bank = question_bank.get_bank(path)
+    progress = synthetic.make_progress(bank.questions, "Synthetic")["Synthetic"]
+    rng = random.Random(0)
+
+    results["scan_pick"] = summarize(time_calls(
+        lambda: _scan_pick(bank.questions, progress["attempted"], rng), max(3, repeat // 10)))
+    results["selector_build"] = summarize(time_calls(
+        lambda: QuestionSelector(bank.ids, progress, index=bank.index), max(3, repeat // 10)))
+
+    # What one session keeps per subject: its selector (the bank itself is shared),
+    # against a copy of the string-keyed progress maps it is built from
+    results["memory_kb"] = {
+        "selector": _traced_kb(lambda: QuestionSelector(bank.ids, progress, index=bank.index)),
+        "progress_dicts": _traced_kb(lambda: json.loads(json.dumps(progress))),
+    }
+
+    selector = QuestionSelector(bank.ids, progress, index=bank.index)
+
+    def pick_and_record():
+        qid, _ = selector.next(rng)
+        selector.record(qid, rng.random() < 0.8)
+
+    results["selector_pick_record"] = summarize(time_calls(pick_and_record, repeat))
+
+    chosen = random.Random(1).sample(bank.questions, 20)
+
+    def cold_render():
+        worksheets._mc_fragment.cache_clear()
+        worksheets._blank_fragment.cache_clear()
+        worksheets.render_worksheet(chosen, "Synthetic")
+
+    results["worksheet_render_cold"] = summarize(time_calls(cold_render, repeat))
+    results["worksheet_render_warm"] = summarize(time_calls(
+        lambda: worksheets.render_worksheet(chosen, "Synthetic"), repeat))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks against synthetic question banks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    all_results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            all_results[size] = bench_size(directory, size, args.repeat)
+            if not args.json:
+                print(f"--- {size} questions")
+                for name, summary in all_results[size].items():
+                    if name == "memory_kb":
+                        for what, kb in summary.items():
+                            print(f"{what + ' per session':<40} {kb:9.1f}KB")
+                    else:
+                        print_row(name, summary)
+    if args.json:
+        print(json.dumps(all_results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Cold-start benchmark: import time of app.py's dependencies and time to first paint.
+
+    python -m benchmarks.bench_startup --runs 5
+
+Every measurement runs in a fresh interpreter so nothing is already imported.
+"Imports" times `import` of the modules app.py pulls in; "first paint" times
+a cold AppTest run of app.py up to the rendered login screen (skipped when
+Streamlit isn't installed). The slowest imports come from -X importtime.
+Everything runs in a scratch copy of data/, since the first paint creates
+files there (analytics.db, thumbnails).
+"""
+import argparse
+import importlib.util
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.bench_flow import copy_app_data
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+APP_MODULES = ["question_bank", "storage", "selector", "worksheets", "instrumentation",
+               "data_context", "analytics", "audio_assets", "image_assets"]
+
+IMPORT_SNIPPET = """
+import time
+started = time.perf_counter()
+import {modules}
+print(time.perf_counter() - started)
+"""
+
+FIRST_PAINT_SNIPPET = """
+import time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app!r}, default_timeout=60)
+at.run()
+print(time.perf_counter() - started)
+"""
+
+
+def _run(snippet, workdir, *flags):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])))
+    result = subprocess.run([sys.executable, *flags, "-c", snippet], cwd=workdir, env=env,
+                            capture_output=True, text=True, check=True)
+    return result
+
+
+def time_snippet(snippet, runs, workdir):
+    return [float(_run(snippet, workdir).stdout.strip().splitlines()[-1]) for _ in range(runs)]
+
+
+def slowest_imports(modules, limit, workdir):
+    """Parse -X importtime output into (cumulative microseconds, module), slowest first."""
+    stderr = _run(f"import {', '.join(modules)}", workdir, "-X", "importtime").stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold import and first-paint time")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="How many of the slowest imports to list")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    have_streamlit = importlib.util.find_spec("streamlit") is not None
+    modules = APP_MODULES if have_streamlit else [m for m in APP_MODULES if not m.endswith("_assets")]
+
+    workdir = tempfile.mkdtemp(prefix="avani-startup-")
+    try:
+        copy_app_data(workdir)
+        results = {"imports_s": time_snippet(IMPORT_SNIPPET.format(modules=", ".join(modules)), args.runs, workdir),
+                   "slowest_imports": slowest_imports(modules, args.top, workdir)}
+        if have_streamlit:
+            snippet = FIRST_PAINT_SNIPPET.format(app=os.path.join(REPO_ROOT, "app.py"))
+            results["first_paint_s"] = time_snippet(snippet, args.runs, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"imports      median {statistics.median(results['imports_s']) * 1e3:8.1f}ms over {args.runs} runs")
+    if "first_paint_s" in results:
+        print(f"first paint  median {statistics.median(results['first_paint_s']) * 1e3:8.1f}ms over {args.runs} runs")
+    else:
+        print("first paint  skipped (streamlit is not installed)")
+    print("slowest imports (cumulative):")
+    for cumulative_us, name in results["slowest_imports"]:
+        print(f"  {cumulative_us / 1e3:8.1f}ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
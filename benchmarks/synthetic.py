@@ -0,0 +1,43 @@
+"""Synthetic question banks and rosters for benchmarking."""
+import json
+import os
+import random
+
+CHAPTERS_PER_BANK = 25
+TOPICS_PER_CHAPTER = 8
+
+
+def make_questions(count, subject="Synthetic", seed=0):
+    rng = random.Random(seed)
+    questions = []
+    for i in range(1, count + 1):
+        chapter = rng.randrange(CHAPTERS_PER_BANK)
+        options = [f"option {i}-{k} {rng.randrange(10 ** 6)}" for k in range(4)]
+        questions.append({
+            "id": f"{subject}_{i}",
+            "chapter": f"Chapter {chapter}",
+            "topic": f"Topic {chapter}.{rng.randrange(TOPICS_PER_CHAPTER)}",
+            "question": f"Synthetic question {i} about {rng.choice(['verbs', 'fractions', 'plants', 'maps'])}?",
+            "options": options,
+            "answer": rng.choice(options),
+        })
+    return questions
+
+
+def write_bank(directory, count, subject="Synthetic", seed=0):
+    """Write a bank of `count` questions and return its path."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{subject.lower()}_{count}.json")
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump({"questions": make_questions(count, subject, seed)}, file)
+    return path
+
+
+def make_progress(questions, subject, attempted_share=0.5, correct_share=0.8, seed=0):
+    """A progress dict in the load_user_progress shape with part of the bank attempted."""
+    rng = random.Random(seed)
+    attempted = {}
+    for q in questions:
+        if rng.random() < attempted_share:
+            attempted[q["id"]] = rng.random() < correct_share
+    return {subject: {"attempted": attempted}}
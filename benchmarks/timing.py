@@ -0,0 +1,35 @@
+"""Small timing helpers shared by the benchmarks."""
+import statistics
+import time
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Summary in milliseconds for a list of durations in seconds."""
+    return {
+        "n": len(samples),
+        "mean_ms": statistics.fmean(samples) * 1e3 if samples else 0.0,
+        "p50_ms": percentile(samples, 50) * 1e3,
+        "p99_ms": percentile(samples, 99) * 1e3,
+    }
+
+
+def time_calls(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def print_row(name, summary):
+    print(f"{name:<40} n={summary['n']:<6} mean={summary['mean_ms']:9.3f}ms "
+          f"p50={summary['p50_ms']:9.3f}ms p99={summary['p99_ms']:9.3f}ms")
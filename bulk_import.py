@@ -0,0 +1,283 @@
+"""
+Streaming import of large question banks from CSV or JSONL.
+
+    python bulk_import.py questions.csv --subject "Maths Grade 5"
+    python bulk_import.py questions.jsonl --subject "Maths Grade 5" --dry-run
+
+Rows are read one at a time, checked with question_bank.validate_question
+and deduplicated by id (first occurrence wins) through a SQLite table on
+disk, so memory use doesn't grow with the size of the source. Valid rows are
+written into one bank file per chapter under data/subjects/<subject>.<version>/
+with a chapters.json index, and the subject is added to (or replaced in) the
+manifest. The app then reads only the chapter files it needs.
+
+Every import writes a new directory and only then switches the manifest
+over to it, so readers find either the old chapters or the new ones, never
+a missing directory. The replaced directory is kept until the next import
+of the subject, for readers that looked it up just before the switch;
+older ones are deleted.
+
+CSV files need the columns id, chapter, topic, question, options and answer.
+options is either a JSON list or the choices separated by "|". JSONL files
+hold one question object per line.
+"""
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+import secrets
+import shutil
+import sqlite3
+import tempfile
+
+import atomic_io
+import question_bank
+
+FIELDS = ("id", "chapter", "topic", "question", "options", "answer")
+
+# Validation problems kept for the report; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+# Chapter spill files held open at once while sorting rows into chapters
+MAX_OPEN_SHARDS = 64
+
+
+class ImportResult:
+    def __init__(self, subject, path):
+        self.subject = subject
+        self.path = path
+        self.imported = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.chapters = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"line {line}: {message}")
+
+
+def _parse_options(value):
+    value = (value or "").strip()
+    if value.startswith("["):
+        return json.loads(value)
+    return [option.strip() for option in value.split("|") if option.strip()]
+
+
+def read_csv(file):
+    """Yield (line number, question dict) from a CSV text stream."""
+    reader = csv.DictReader(file)
+    for row in reader:
+        q = {field: (row.get(field) or "").strip() for field in FIELDS if field in row}
+        try:
+            q["options"] = _parse_options(row.get("options"))
+        except ValueError:
+            pass  # left as a string, which validation reports
+        yield reader.line_num, q
+
+
+def read_jsonl(file):
+    """Yield (line number, question dict) from a JSONL text stream; bad lines yield an error string."""
+    for line_num, line in enumerate(file, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            q = json.loads(line)
+        except ValueError as e:
+            yield line_num, f"not valid JSON: {e}"
+            continue
+        if not isinstance(q, dict):
+            yield line_num, f"expected a question object, got {type(q).__name__}"
+            continue
+        yield line_num, q
+
+
+READERS = {"csv": read_csv, "jsonl": read_jsonl}
+
+
+def subject_dir_name(subject):
+    """
+    Directory name for a subject's shards: the name lower-cased and reduced
+    to [a-z0-9_]+ (Maths Grade 5 -> maths_grade_5). Names written only in
+    other scripts get a name derived from their hash. Raises ValueError if
+    the name has no letters or digits at all.
+    """
+    if not any(c.isalnum() for c in subject):
+        raise ValueError(f"subject name {subject!r} has no letters or digits to name its directory")
+    name = re.sub(r"[^a-z0-9_]+", "_", subject.lower()).strip("_")
+    if name in ("", ".", ".."):
+        name = "subject_" + hashlib.sha1(subject.encode('utf-8')).hexdigest()[:12]
+    return name
+
+
+def _subject_dir(subject):
+    """Path of a subject's shard directory, checked to be directly inside SUBJECTS_DIR."""
+    out_dir = os.path.join(question_bank.SUBJECTS_DIR, subject_dir_name(subject))
+    root = os.path.realpath(question_bank.SUBJECTS_DIR)
+    if os.path.dirname(os.path.realpath(out_dir)) != root:
+        raise ValueError(f"subject name {subject!r} does not map to a directory under {question_bank.SUBJECTS_DIR}")
+    return out_dir
+
+
+def _shard_name(chapter):
+    return "ch_" + hashlib.sha1(chapter.encode('utf-8')).hexdigest()[:12]
+
+
+class _ShardWriter:
+    """Appends rows to one JSONL spill file per chapter, keeping a bounded number open."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.counts = {}  # chapter -> rows, in first-seen order
+        self._open = {}
+
+    def write(self, q):
+        chapter = q.get("chapter", "")
+        file = self._open.pop(chapter, None)
+        if file is None:
+            if len(self._open) >= MAX_OPEN_SHARDS:
+                oldest = next(iter(self._open))
+                self._open.pop(oldest).close()
+            file = open(os.path.join(self.directory, _shard_name(chapter) + ".jsonl"), 'a', encoding='utf-8')
+        self._open[chapter] = file  # most recently used last
+        file.write(json.dumps(q, ensure_ascii=False) + "\n")
+        self.counts[chapter] = self.counts.get(chapter, 0) + 1
+
+    def close(self):
+        for file in self._open.values():
+            file.close()
+        self._open = {}
+
+    def finish(self, out_dir):
+        """Turn every spill file into a {"questions": [...]} bank file, one row at a time."""
+        self.close()
+        chapters = []
+        for chapter, count in self.counts.items():
+            name = _shard_name(chapter)
+            spill = os.path.join(self.directory, name + ".jsonl")
+            with open(spill, 'r', encoding='utf-8') as src, \
+                    open(os.path.join(out_dir, name + ".json"), 'w', encoding='utf-8') as dst:
+                dst.write('{"questions": [\n')
+                for i, line in enumerate(src):
+                    dst.write(("," if i else "") + line)
+                dst.write(']}\n')
+            os.remove(spill)
+            chapters.append({"name": chapter, "file": name + ".json", "count": count})
+        with open(os.path.join(out_dir, question_bank.SHARD_INDEX), 'w', encoding='utf-8') as file:
+            json.dump({"chapters": chapters}, file, indent=4, ensure_ascii=False)
+
+
+def import_questions(file, subject, fmt, dry_run=False):
+    """
+    Import questions for `subject` from a text stream in format "csv" or
+    "jsonl", replacing any questions the subject had. Returns an ImportResult.
+    Raises ValueError if the subject name can't be turned into a directory name.
+    """
+    base = _subject_dir(subject)
+    out_dir = f"{base}.{secrets.token_hex(4)}"
+    result = ImportResult(subject, out_dir)
+    work = tempfile.mkdtemp(prefix=".import.", dir=question_bank.SUBJECTS_DIR)
+    try:
+        seen = sqlite3.connect(os.path.join(work, "seen.db"))
+        seen.execute("CREATE TABLE ids (id TEXT PRIMARY KEY)")
+        shards = _ShardWriter(work)
+        chapters = set()
+        try:
+            for line_num, q in READERS[fmt](file):
+                if isinstance(q, str):
+                    result.error(line_num, q)
+                    continue
+                problems = question_bank.validate_question(q)
+                if problems:
+                    result.error(line_num, f"{q.get('id', '?')}: " + "; ".join(problems))
+                    continue
+                if seen.execute("INSERT OR IGNORE INTO ids (id) VALUES (?)", (q["id"],)).rowcount == 0:
+                    result.duplicates += 1
+                    continue
+                result.imported += 1
+                chapters.add(q.get("chapter", ""))
+                if not dry_run:
+                    shards.write({field: q[field] for field in FIELDS if field in q})
+        finally:
+            shards.close()
+            seen.close()
+        result.chapters = len(chapters)
+
+        if dry_run or not result.imported:
+            return result
+        staged = os.path.join(work, "bank")
+        os.makedirs(staged)
+        shards.finish(staged)
+        # Publish under a new name; the manifest switch below is what readers see
+        os.replace(staged, out_dir)
+        _add_to_manifest(subject, os.path.basename(out_dir))
+        _remove_old_imports(base)
+        return result
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def _add_to_manifest(subject, directory):
+    def add(data):
+        entries = [e for e in data["subjects"] if e["name"] != subject]
+        entries.append({"name": subject, "dir": directory})
+        data["subjects"] = entries
+        return data
+
+    atomic_io.update_json(question_bank.MANIFEST_FILE, add, {"subjects": []}, indent=4, ensure_ascii=False)
+
+
+def _remove_old_imports(base):
+    """
+    Delete earlier import directories named after `base`, keeping the newest
+    one the manifest no longer uses and any the manifest still refers to
+    (another subject can reduce to the same name).
+    """
+    prefix = os.path.basename(base)
+    pattern = re.compile(re.escape(prefix) + r"(\.[0-9a-f]+)?")
+    in_use = {os.path.basename(os.path.normpath(path)) for path in question_bank.load_manifest().values()}
+    old = []
+    with os.scandir(question_bank.SUBJECTS_DIR) as it:
+        for item in it:
+            if item.is_dir(follow_symlinks=False) and pattern.fullmatch(item.name) and item.name not in in_use:
+                old.append((item.stat().st_mtime_ns, item.path))
+    old.sort()
+    for _, path in old[:-1]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def import_upload(uploaded, subject, dry_run=False):
+    """Import a Streamlit UploadedFile, streaming it as text; the format comes from its name."""
+    fmt = "jsonl" if uploaded.name.lower().endswith((".jsonl", ".ndjson")) else "csv"
+    text = io.TextIOWrapper(uploaded, encoding='utf-8-sig', newline='')
+    return import_questions(text, subject, fmt, dry_run=dry_run)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a question bank from CSV or JSONL")
+    parser.add_argument("source")
+    parser.add_argument("--subject", required=True, help="Subject name shown in the app")
+    parser.add_argument("--format", choices=sorted(READERS), help="Default: from the file extension")
+    parser.add_argument("--dry-run", action="store_true", help="Validate only, write nothing")
+    args = parser.parse_args()
+
+    fmt = args.format or ("jsonl" if args.source.lower().endswith((".jsonl", ".ndjson")) else "csv")
+    with open(args.source, 'r', encoding='utf-8-sig', newline='') as file:
+        try:
+            result = import_questions(file, args.subject, fmt, dry_run=args.dry_run)
+        except ValueError as e:
+            parser.error(str(e))
+    for error in result.errors:
+        print(error)
+    print(f"{result.imported} questions in {result.chapters} chapters, "
+          f"{result.duplicates} duplicate ids skipped, {result.invalid} invalid rows")
+    if not args.dry_run and result.imported:
+        print(f"Wrote {result.path}")
+
+
+if __name__ == "__main__":
+    main()
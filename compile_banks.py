@@ -0,0 +1,127 @@
+"""
+Validate the question banks and compile them into a single pre-indexed file.
+
+    python compile_banks.py          # validate, then write data/compiled/banks.pickle
+    python compile_banks.py --check  # validate only (exit status 1 on errors)
+
+Every subject listed in data/subjects/manifest.json is checked for missing
+fields, answers that aren't among the options and duplicate ids. The
+compiled file holds ready-built QuestionBank objects, each pickled on its
+own after a small header that says where each one is, with repeated strings
+(chapters, topics, options) interned so they are stored once per bank. The
+app loads a subject's bank from it in place of the JSON whenever the
+recorded source mtime/size still match, so editing a JSON file during
+development just falls back to parsing it. Banks loaded this way count
+towards question_bank.MAX_CACHED_BANKS like parsed ones.
+"""
+import argparse
+import json
+import os
+import pickle
+import sys
+
+import question_bank
+from question_bank import QuestionBank
+
+
+def _intern(value):
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, list):
+        return [_intern(v) for v in value]
+    if isinstance(value, dict):
+        return {sys.intern(k): _intern(v) for k, v in value.items()}
+    return value
+
+
+def validate_bank(path):
+    """Return (questions, errors) for one bank file."""
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+    except (OSError, ValueError) as e:
+        return [], [f"{path}: {e}"]
+    questions = data.get("questions") if isinstance(data, dict) else None
+    if not isinstance(questions, list):
+        return [], [f"{path}: expected an object with a 'questions' list"]
+
+    errors = []
+    seen = set()
+    for index, q in enumerate(questions):
+        label = q.get("id", f"#{index}") if isinstance(q, dict) else f"#{index}"
+        errors.extend(f"{path}: {label}: {problem}" for problem in question_bank.validate_question(q))
+        if isinstance(q, dict) and "id" in q:
+            if q["id"] in seen:
+                errors.append(f"{path}: {label}: duplicate id")
+            seen.add(q["id"])
+    return questions, errors
+
+
+def compile_banks(output=question_bank.COMPILED_FILE, check_only=False):
+    """Validate every bank in the manifest and write the compiled artifact. Returns a list of errors."""
+    manifest = question_bank.load_manifest()
+    if not manifest:
+        return [f"{question_bank.MANIFEST_FILE}: no subjects listed"]
+
+    errors = []
+    banks = {}
+    for subject, path in manifest.items():
+        if not os.path.exists(path):
+            errors.append(f"{subject}: bank file {path} not found")
+            continue
+        if os.path.isdir(path):
+            # Sharded by bulk_import.py: already split per chapter, so validated but not compiled
+            for _, shard in question_bank._shard_index(path):
+                errors.extend(validate_bank(shard)[1])
+            continue
+        version = question_bank._file_version(path)
+        questions, bank_errors = validate_bank(path)
+        errors.extend(bank_errors)
+        banks[os.path.normpath(path)] = (version, QuestionBank(_intern(questions)))
+
+    listed = {os.path.normpath(p) for p in manifest.values()}
+    for name in sorted(os.listdir(question_bank.SUBJECTS_DIR)):
+        path = os.path.normpath(os.path.join(question_bank.SUBJECTS_DIR, name))
+        if name.endswith(".json") and path != os.path.normpath(question_bank.MANIFEST_FILE) and path not in listed:
+            print(f"warning: {path} is not listed in the manifest", file=sys.stderr)
+
+    if errors or check_only:
+        return errors
+
+    index = {}
+    payloads = []
+    offset = 0
+    for path, (version, bank) in banks.items():
+        payload = pickle.dumps(bank, protocol=pickle.HIGHEST_PROTOCOL)
+        index[path] = (version, offset, len(payload))
+        payloads.append(payload)
+        offset += len(payload)
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    tmp = output + ".tmp"
+    with open(tmp, 'wb') as file:
+        pickle.dump({"format": question_bank.COMPILED_FORMAT, "banks": index}, file,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+        for payload in payloads:
+            file.write(payload)
+    os.replace(tmp, output)
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate and compile question banks")
+    parser.add_argument("--check", action="store_true", help="Only validate, don't write the artifact")
+    parser.add_argument("--output", default=question_bank.COMPILED_FILE)
+    args = parser.parse_args()
+
+    errors = compile_banks(args.output, check_only=args.check)
+    for error in errors:
+        print(error, file=sys.stderr)
+    if errors:
+        sys.exit(1)
+    if not args.check:
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Per-rerun unit of work for users and progress.
+
+app.py creates one DataContext at the top of every script run. Screens read
+users and progress through it, so each record is loaded at most once per
+rerun and every screen sees the same snapshot. Score increments and attempts
+are applied to that snapshot immediately and written to storage once, when
+flush() runs at the end of the rerun. If an analytics sink is given, each
+flushed attempt is also folded into its summary tables.
+
+With a writer (see write_behind.py) flush() only queues the changes, and
+reads overlay whatever the writer hasn't written yet.
+"""
+import instrumentation
+import progress_log
+
+
+class DataContext:
+    def __init__(self, store, progress_store=progress_log, analytics=None, writer=None):
+        self.store = store
+        self.progress_store = progress_store
+        self.analytics = analytics
+        self.writer = writer
+        self._users = None
+        self._users_version = None
+        self._user = {}
+        self._progress = {}
+        self._pending_scores = {}    # (username, subject) -> delta
+        self._pending_attempts = []  # kwargs for progress_store.record_attempt
+
+    def _read_scores(self, load):
+        """load() with any queued score increments applied to the users it returns."""
+        if self.writer is None:
+            return load()
+        result, deltas = self.writer.read_scores(load)
+        users = result[0] if isinstance(result, tuple) else result
+        by_name = {u['username']: u for u in (users if isinstance(users, list) else [users]) if u}
+        for (username, subject), delta in deltas.items():
+            if username in by_name:
+                scores = by_name[username].setdefault("scores", {})
+                scores[subject] = scores.get(subject, 0) + delta
+        return result
+
+    def users(self):
+        if self._users is None:
+            with instrumentation.timer("load_users"):
+                if hasattr(self.store, "load_users_versioned"):
+                    self._users, self._users_version = self._read_scores(self.store.load_users_versioned)
+                else:
+                    self._users = self._read_scores(self.store.load_users)
+            self._user = {u['username']: u for u in self._users}
+        return self._users
+
+    def get_user(self, username):
+        if self._users is not None:
+            return self._user.get(username)
+        if username not in self._user:
+            with instrumentation.timer("get_user"):
+                self._user[username] = self._read_scores(lambda: self.store.get_user(username))
+        return self._user[username]
+
+    def is_tutor(self, username):
+        user = self.get_user(username)
+        return user is not None and user.get("role", "").lower() == "tutor"
+
+    def progress(self, username):
+        if username not in self._progress:
+            with instrumentation.timer("load_user_progress"):
+                if self.writer is None:
+                    self._progress[username] = self.progress_store.load_progress(username)
+                else:
+                    progress, pending = self.writer.read_progress(
+                        username, lambda: self.progress_store.load_progress(username))
+                    for attempt in pending:
+                        progress_log.apply_event(progress, attempt)
+                    self._progress[username] = progress
+        return self._progress[username]
+
+    def save_users(self, users):
+        """
+        Write users back. Raises atomic_io.VersionConflict if another process
+        changed them after this rerun read them. Queued score increments are
+        written first; if any landed after the users were read that is a
+        conflict too, and a reload (which no longer needs the overlay) fixes it.
+        """
+        if self.writer is not None:
+            self.writer.flush()
+        with instrumentation.timer("save_users"):
+            self.store.save_users(users, version=self._users_version)
+        self._users = None
+        self._users_version = None
+        self._user = {}
+
+    def increment_score(self, username, subject, delta=1):
+        key = (username, subject)
+        self._pending_scores[key] = self._pending_scores.get(key, 0) + delta
+        user = self._user.get(username)
+        if user is not None:
+            scores = user.setdefault("scores", {})
+            scores[subject] = scores.get(subject, 0) + delta
+
+    def record_attempt(self, username, subject, question_id, correct, **fields):
+        attempt = dict(username=username, subject=subject, question_id=question_id,
+                       correct=correct, **fields)
+        self._pending_attempts.append(attempt)
+        if username in self._progress:
+            progress_log.apply_event(self._progress[username], {
+                "subject": subject, "question_id": question_id, "correct": bool(correct),
+                "box": fields.get("box"), "due": fields.get("due"),
+            })
+
+    @property
+    def dirty(self):
+        return bool(self._pending_scores or self._pending_attempts)
+
+    def flush(self):
+        """Write (or queue, with a writer) every pending change. Called once at the end of the rerun."""
+        if not self.dirty:
+            return
+        with instrumentation.timer("flush"):
+            pending_scores, self._pending_scores = self._pending_scores, {}
+            pending_attempts, self._pending_attempts = self._pending_attempts, []
+            if self.writer is not None:
+                self.writer.submit(pending_scores, pending_attempts)
+                return
+            for (username, subject), delta in pending_scores.items():
+                self.store.increment_score(username, subject, delta)
+            for attempt in pending_attempts:
+                self.progress_store.record_attempt(**attempt)
+                if self.analytics is not None:
+                    self.analytics.record_answer(**attempt)
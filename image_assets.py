@@ -0,0 +1,127 @@
+"""
+Downscaled, browser-cacheable copies of the logo and avatars.
+
+image() writes a WebP copy of a source image at a given width into
+static/thumbs/, named after the source's mtime so an edited picture gets a
+new file (and a new URL), and renders an <img> tag pointing at it under
+app/static/. The browser then fetches each thumbnail once and lazy-loads the
+ones that are off screen. Without Pillow or static serving the original
+image file is used instead.
+"""
+import glob
+import importlib.util
+import os
+import tempfile
+import threading
+from html import escape
+
+import streamlit as st
+
+# Pillow is only imported when a thumbnail actually has to be generated
+HAVE_PILLOW = importlib.util.find_spec("PIL") is not None
+
+THUMBS_DIR = './static/thumbs/'
+STATIC_URL = 'app/static/thumbs/'
+
+LOGO_FILE = './data/logo.png'
+LOGO_WIDTH = 150
+AVATAR_LOGIN_WIDTH = 150
+AVATAR_RAIL_WIDTH = 80
+
+# (source, width, mtime_ns) -> thumbnail file name, or None if there is no source
+_thumbs = {}
+_lock = threading.Lock()
+# (source, width, mtime_ns) -> lock held while that thumbnail is generated
+_making = {}
+
+
+def _static_serving_enabled():
+    try:
+        return bool(st.get_option("server.enableStaticServing"))
+    except Exception:
+        return False
+
+
+def avatar_file(username):
+    return f"./data/{username}.png".lower()
+
+
+def _make_thumbnail(source, width, mtime_ns):
+    from PIL import Image
+
+    stem = os.path.splitext(os.path.basename(source))[0]
+    name = f"{stem}_{width}_{mtime_ns}.webp"
+    path = os.path.join(THUMBS_DIR, name)
+    if not os.path.exists(path):
+        os.makedirs(THUMBS_DIR, exist_ok=True)
+        with Image.open(source) as img:
+            # Render at 2x for high-DPI screens; still far smaller than the originals
+            target = min(img.width, width * 2)
+            height = max(1, round(img.height * target / img.width))
+            thumb = img.resize((target, height), Image.LANCZOS)
+            # A temp file of our own, so concurrent writers (other processes too) don't collide
+            fd, tmp = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=THUMBS_DIR)
+            try:
+                with os.fdopen(fd, 'wb') as file:
+                    thumb.save(file, format="WEBP", quality=85)
+                os.replace(tmp, path)
+            except BaseException:
+                try:
+                    os.remove(tmp)
+                except FileNotFoundError:
+                    pass
+                raise
+        # Drop thumbnails made from older versions of this picture
+        for stale in glob.glob(os.path.join(THUMBS_DIR, f"{stem}_{width}_*.webp")):
+            if stale != path:
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass  # another writer removed it first
+    return name
+
+
+def thumbnail_name(source, width):
+    """File name of the cached thumbnail under THUMBS_DIR, creating it if needed; None if no source."""
+    try:
+        mtime_ns = os.stat(source).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    key = (source, width, mtime_ns)
+    with _lock:
+        if key in _thumbs:
+            return _thumbs[key]
+        making = _making.setdefault(key, threading.Lock())
+    # One thread generates each thumbnail; the rest of a login burst waits for it
+    with making:
+        with _lock:
+            if key in _thumbs:
+                return _thumbs[key]
+        name = _make_thumbnail(source, width, mtime_ns)
+        with _lock:
+            _thumbs[key] = name
+            _making.pop(key, None)
+    return name
+
+
+def image(source, width, caption=None, container=st):
+    """
+    Show `source` at `width` pixels. Returns False if the source doesn't exist.
+    `container` can be st.sidebar or a column.
+    """
+    if not HAVE_PILLOW or not _static_serving_enabled():
+        if not os.path.exists(source):
+            return False
+        container.image(source, caption=caption, width=width)
+        return True
+
+    name = thumbnail_name(source, width)
+    if name is None:
+        return False
+    caption_html = f"<figcaption style='text-align:center'>{escape(caption)}</figcaption>" if caption else ""
+    container.markdown(
+        f"<figure style='margin:0'><img src='{STATIC_URL}{name}' width='{width}' "
+        f"loading='lazy' alt='{escape(caption or '')}'>{caption_html}</figure>",
+        unsafe_allow_html=True
+    )
+    return True
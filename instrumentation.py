@@ -0,0 +1,146 @@
+"""
+Lightweight timers and counters for the per-rerun hot path.
+
+Wrap a function with @timed("name") or a block with `with timer("name"):`.
+Timings go into an in-memory ring buffer (the last RING_SIZE samples) and
+running totals per name. Nothing is recorded unless metrics are enabled,
+either with AVANI_METRICS=1 or set_enabled(True); when disabled a timed
+call costs one extra function call and a global lookup.
+
+Snapshots can be written out as JSON lines or in the Prometheus text format.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from functools import wraps
+
+ENABLED = os.environ.get("AVANI_METRICS", "") not in ("", "0")
+
+# Number of individual samples kept for the "recent" view and JSONL export
+RING_SIZE = 2048
+
+_samples = deque(maxlen=RING_SIZE)   # (timestamp, name, seconds)
+_totals = {}                          # name -> [count, total seconds, max seconds]
+_counters = {}                        # name -> count
+_lock = threading.Lock()
+_NULL = nullcontext()
+
+
+def set_enabled(enabled):
+    global ENABLED
+    ENABLED = bool(enabled)
+
+
+def record(name, seconds):
+    with _lock:
+        _samples.append((time.time(), name, seconds))
+        total = _totals.get(name)
+        if total is None:
+            _totals[name] = [1, seconds, seconds]
+        else:
+            total[0] += 1
+            total[1] += seconds
+            if seconds > total[2]:
+                total[2] = seconds
+
+
+def count(name, n=1):
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+class _Timer:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.started)
+
+
+def timer(name):
+    """Context manager that times its block under `name`."""
+    return _Timer(name) if ENABLED else _NULL
+
+
+def timed(name=None):
+    """Decorator that times every call of the function."""
+    def decorate(fn):
+        label = name or fn.__name__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record(label, time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+
+def summary():
+    """Per-name totals as a list of dicts, slowest total first."""
+    with _lock:
+        rows = [
+            {"name": name, "count": c, "total_ms": t * 1e3, "mean_ms": t / c * 1e3, "max_ms": m * 1e3}
+            for name, (c, t, m) in _totals.items()
+        ]
+        counters = dict(_counters)
+    rows.sort(key=lambda r: r["total_ms"], reverse=True)
+    return rows, counters
+
+
+def recent(limit=100):
+    with _lock:
+        samples = list(_samples)[-limit:]
+    return [{"ts": ts, "name": name, "ms": seconds * 1e3} for ts, name, seconds in reversed(samples)]
+
+
+def reset():
+    with _lock:
+        _samples.clear()
+        _totals.clear()
+        _counters.clear()
+
+
+def prometheus_text():
+    rows, counters = summary()
+    lines = [
+        "# TYPE avani_call_seconds summary",
+    ]
+    for row in rows:
+        label = f'{{name="{row["name"]}"}}'
+        lines.append(f"avani_call_seconds_count{label} {row['count']}")
+        lines.append(f"avani_call_seconds_sum{label} {row['total_ms'] / 1e3:.6f}")
+    lines.append("# TYPE avani_events_total counter")
+    for name, value in sorted(counters.items()):
+        lines.append(f'avani_events_total{{name="{name}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def export(path, fmt="jsonl"):
+    """Write the current metrics to a local file: the ring buffer as JSONL, or Prometheus text."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if fmt == "prometheus":
+        with open(path, "w") as file:
+            file.write(prometheus_text())
+        return path
+    with _lock:
+        samples = list(_samples)
+    with open(path, "a") as file:
+        for ts, name, seconds in samples:
+            file.write(json.dumps({"ts": ts, "name": name, "ms": seconds * 1e3}) + "\n")
+    return path
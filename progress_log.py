@@ -0,0 +1,183 @@
+"""
+Per-user progress stored as an append-only event log.
+
+Every answered question appends one JSON line to
+data/user_progress/<user>.log.jsonl:
+
+    {"user": ..., "subject": ..., "question_id": ..., "correct": true,
+     "ts": 1700000000.0, "latency": 4.2, "box": 2, "due": 1700259200.0,
+     "chapter": ..., "topic": ..., "review": true}
+
+"review" is only present (and true) for a repeat of a question the user had
+already answered correctly; those don't add to the score.
+
+The current state ({subject: {"attempted": {question_id: bool}}}, the same
+shape the old <user>.json files had, plus a "review" map of
+{question_id: [box, due]} for the spaced-repetition selector) is the last
+snapshot with the log replayed on top. Once the log grows past COMPACT_BYTES
+it is folded into a new snapshot and the replayed segment is archived under
+data/user_progress/history/<user>/ so the full attempt history is kept.
+Readers share a lock that compaction takes exclusively, so a read never sees
+the old snapshot without the segment it is missing.
+"""
+import json
+import os
+import time
+from contextlib import nullcontext
+
+import atomic_io
+
+USER_PROGRESS_DIR = './data/user_progress/'
+
+# Fold the log into the snapshot once it reaches this size
+COMPACT_BYTES = 64 * 1024
+
+
+def _snapshot_path(username):
+    return os.path.join(USER_PROGRESS_DIR, f"{username}.json")
+
+
+def _log_path(username):
+    return os.path.join(USER_PROGRESS_DIR, f"{username}.log.jsonl")
+
+
+def _compacting_path(username):
+    return os.path.join(USER_PROGRESS_DIR, f"{username}.log.jsonl.compacting")
+
+
+def _history_dir(username):
+    return os.path.join(USER_PROGRESS_DIR, "history", username)
+
+
+def _read_events(path):
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # A torn final line from a crash mid-append; everything before it is intact
+                continue
+
+
+def apply_event(progress, event):
+    """Fold a single attempt event into a progress dict."""
+    subject_progress = progress.setdefault(event["subject"], {})
+    subject_progress.setdefault("attempted", {})[event["question_id"]] = event["correct"]
+    if event.get("box") is not None:
+        subject_progress.setdefault("review", {})[event["question_id"]] = [event["box"], event["due"]]
+    return progress
+
+
+def load_progress(username):
+    """Rebuild the user's current progress from the snapshot and the event log."""
+    # Compaction holds this lock exclusively from moving the log aside until the
+    # segment is archived; without it a reader could see the old snapshot and
+    # then miss the segment once it has moved to history/
+    with atomic_io.locked(_compacting_path(username), shared=True):
+        return _load_progress(username)
+
+
+def _load_progress(username):
+    progress = {}
+    snapshot = _snapshot_path(username)
+    if os.path.exists(snapshot):
+        with open(snapshot, 'r', encoding='utf-8') as file:
+            progress = json.load(file)
+    # A segment left behind by an interrupted compaction is replayed first;
+    # replaying is idempotent so it does no harm if the snapshot already has it
+    for path in (_compacting_path(username), _log_path(username)):
+        for event in _read_events(path):
+            apply_event(progress, event)
+    return progress
+
+
+def record_attempt(username, subject, question_id, correct, latency=None, ts=None, box=None, due=None,
+                   chapter=None, topic=None, review=False):
+    """Durably append one attempt to the user's log."""
+    return record_attempts(username, [dict(subject=subject, question_id=question_id, correct=correct,
+                                           latency=latency, ts=ts, box=box, due=due,
+                                           chapter=chapter, topic=topic, review=review)])[0]
+
+
+def record_attempts(username, attempts, commit=None):
+    """
+    Durably append several attempts (dicts of record_attempt's arguments) to
+    the user's log with a single write and fsync. Returns the events written.
+    `commit`, if given, is a context manager factory entered around just the
+    write, the moment readers start seeing the new events.
+    """
+    events = []
+    for attempt in attempts:
+        event = {
+            "user": username,
+            "subject": attempt["subject"],
+            "question_id": attempt["question_id"],
+            "correct": bool(attempt["correct"]),
+            "ts": time.time() if attempt.get("ts") is None else attempt["ts"],
+            "latency": attempt.get("latency"),
+        }
+        if attempt.get("box") is not None:
+            event["box"] = attempt["box"]
+            event["due"] = attempt.get("due")
+        # Kept with the attempt so analytics never has to look the question up
+        for field in ("chapter", "topic"):
+            if attempt.get(field) is not None:
+                event[field] = attempt[field]
+        if attempt.get("review"):
+            event["review"] = True
+        events.append(event)
+    if not events:
+        return events
+    data = "".join(json.dumps(event, ensure_ascii=False) + "\n" for event in events).encode('utf-8')
+    log = _log_path(username)
+    # Appenders share the lock; compaction takes it exclusively to swap the log out
+    with atomic_io.locked(log, shared=True):
+        fd = os.open(log, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            with commit() if commit is not None else nullcontext():
+                os.write(fd, data)
+            os.fsync(fd)
+            size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+
+    if size >= COMPACT_BYTES:
+        compact(username)
+    return events
+
+
+def compact(username):
+    """Fold the event log into a fresh snapshot and archive the replayed segment."""
+    log = _log_path(username)
+    compacting = _compacting_path(username)
+    # One compaction per user at a time, across processes
+    with atomic_io.locked(compacting):
+        # Waits for in-flight appends; new ones go to a fresh log while we work on this segment
+        with atomic_io.locked(log):
+            if os.path.exists(log) and not os.path.exists(compacting):
+                os.replace(log, compacting)
+        if not os.path.exists(compacting):
+            return
+
+        progress = _load_progress(username)
+        atomic_io.atomic_write_json(_snapshot_path(username), progress, indent=4, ensure_ascii=False)
+
+        history = _history_dir(username)
+        os.makedirs(history, exist_ok=True)
+        os.replace(compacting, os.path.join(history, f"{time.time_ns()}.jsonl"))
+
+
+def iter_history(username):
+    """Yield every recorded attempt for the user, oldest first. Holds off compaction until done."""
+    with atomic_io.locked(_compacting_path(username), shared=True):
+        history = _history_dir(username)
+        if os.path.isdir(history):
+            for name in sorted(os.listdir(history), key=lambda n: int(n.split('.')[0])):
+                yield from _read_events(os.path.join(history, name))
+        yield from _read_events(_compacting_path(username))
+        yield from _read_events(_log_path(username))
@@ -0,0 +1,276 @@
+import json
+import os
+import pickle
+import sys
+import threading
+from collections import OrderedDict
+
+SUBJECTS_DIR = './data/subjects/'
+MANIFEST_FILE = os.path.join(SUBJECTS_DIR, 'manifest.json')
+
+# Pre-indexed banks written by compile_banks.py; used when it matches the JSON sources.
+# A pickled header {"format", "banks": {source path: ((mtime_ns, size), offset, length)}}
+# followed by one pickled QuestionBank per source, at `offset` bytes past the header
+COMPILED_FILE = './data/compiled/banks.pickle'
+COMPILED_FORMAT = 3
+
+REQUIRED_FIELDS = ("id", "chapter", "question", "options", "answer")
+
+# Upper bound on the number of parsed subject files kept in memory at once
+MAX_CACHED_BANKS = 16
+
+# Index file of a sharded subject directory (written by bulk_import.py):
+# {"chapters": [{"name": ..., "file": ..., "count": ...}]}, one bank file per chapter
+SHARD_INDEX = 'chapters.json'
+
+
+class Question:
+    """
+    One question, read-only and shared by every session. Kept in __slots__
+    rather than a dict; q['field'], q.get() and `in` work like on the dicts
+    it is built from. Fields other than the standard ones go in `extra`.
+    """
+
+    __slots__ = ("id", "chapter", "topic", "question", "options", "answer", "extra")
+    FIELDS = ("id", "chapter", "topic", "question", "options", "answer")
+
+    def __init__(self, data):
+        for field in self.FIELDS:
+            value = data.get(field)
+            if field in ("id", "chapter", "topic") and isinstance(value, str):
+                value = sys.intern(value)
+            elif field == "options" and isinstance(value, list):
+                value = tuple(value)
+            setattr(self, field, value)
+        self.extra = {k: v for k, v in data.items() if k not in self.FIELDS} or None
+
+    def get(self, key, default=None):
+        if key in self.FIELDS:
+            value = getattr(self, key)
+        else:
+            value = self.extra.get(key) if self.extra else None
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def to_dict(self):
+        d = {field: getattr(self, field) for field in self.FIELDS if getattr(self, field) is not None}
+        if isinstance(d.get("options"), tuple):
+            d["options"] = list(d["options"])
+        d.update(self.extra or {})
+        return d
+
+    def __repr__(self):
+        return f"Question({self.id!r})"
+
+
+class QuestionBank:
+    """
+    A parsed subject file plus lookup indexes over its questions. Each
+    question also has a small integer index (its position in `questions`
+    and `ids`), so per-session state can refer to questions by number.
+    """
+
+    def __init__(self, questions):
+        self.questions = tuple(q if isinstance(q, Question) else Question(q) for q in questions)
+        self.ids = tuple(q.id for q in self.questions)
+        self.index = {qid: i for i, qid in enumerate(self.ids)}
+        self.by_id = {}
+        self.by_chapter = {}
+        self.by_topic = {}
+        for q in self.questions:
+            self.by_id[q['id']] = q
+            self.by_chapter.setdefault(q.get('chapter', ''), []).append(q)
+            self.by_topic.setdefault(q.get('topic', ''), []).append(q)
+
+    def __len__(self):
+        return len(self.questions)
+
+
+def validate_question(q):
+    """Return a list of problems with one question dict; empty if it is usable."""
+    if not isinstance(q, dict):
+        return ["question is not an object"]
+    errors = [f"missing '{field}'" for field in REQUIRED_FIELDS if field not in q]
+    options = q.get("options")
+    if "options" in q and (not isinstance(options, list) or len(options) < 2):
+        errors.append("'options' must be a list of at least two choices")
+    elif isinstance(options, list):
+        if len(set(map(str, options))) != len(options):
+            errors.append("'options' has duplicates")
+        if "answer" in q and q["answer"] not in options:
+            errors.append(f"answer {q['answer']!r} is not one of the options")
+    for field in ("id", "chapter", "question"):
+        if field in q and not isinstance(q[field], str):
+            errors.append(f"'{field}' must be a string")
+    return errors
+
+
+# path, or (directory, chapters) for sharded subjects -> (version, QuestionBank), least recently used first
+_banks = OrderedDict()
+_lock = threading.Lock()
+
+_manifest = (None, {})
+# directory -> (version, [(chapter, shard path)])
+_shard_indexes = {}
+# (artifact version, header length, header["banks"]); banks themselves go through _banks
+_compiled = (None, 0, {})
+
+
+def _file_version(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def bank_version(path):
+    """
+    (mtime_ns, size) of a bank file; changes whenever the file is edited. For
+    a sharded subject directory, the newest mtime and total size of its shards.
+    """
+    if os.path.isdir(path):
+        versions = [_file_version(os.path.join(path, SHARD_INDEX))]
+        versions += [_file_version(shard) for _, shard in _shard_index(path)]
+        return (max(v[0] for v in versions), sum(v[1] for v in versions))
+    return _file_version(path)
+
+
+def _shard_index(directory):
+    """[(chapter, shard path)] for a sharded subject directory, re-read when its index changes."""
+    index_file = os.path.join(directory, SHARD_INDEX)
+    version = _file_version(index_file)
+    cached = _shard_indexes.get(directory)
+    if cached is None or cached[0] != version:
+        with open(index_file, 'r', encoding='utf-8') as file:
+            entries = json.load(file)["chapters"]
+        cached = (version, [(e["name"], os.path.join(directory, e["file"])) for e in entries])
+        _shard_indexes[directory] = cached
+    return cached[1]
+
+
+def chapter_names(path):
+    """Chapters of a subject; for sharded subjects this reads only the index."""
+    if os.path.isdir(path):
+        return [chapter for chapter, _ in _shard_index(path)]
+    bank = get_bank(path)
+    return list(bank.by_chapter) if bank is not None else []
+
+
+def load_manifest():
+    """
+    Return {subject name: bank path} from data/subjects/manifest.json, in
+    listed order. Sharded subjects ({"dir": ...}) map to their directory.
+    """
+    global _manifest
+    try:
+        version = _file_version(MANIFEST_FILE)
+    except FileNotFoundError:
+        return {}
+    if _manifest[0] != version:
+        with open(MANIFEST_FILE, 'r', encoding='utf-8') as file:
+            entries = json.load(file)["subjects"]
+        _manifest = (version, {e["name"]: os.path.join(SUBJECTS_DIR, e.get("file") or e["dir"])
+                                for e in entries})
+    return _manifest[1]
+
+
+def subject_names():
+    return list(load_manifest())
+
+
+def subject_file(subject):
+    """Path of the bank file for a subject, from the manifest or else by name (Social Studies -> social_studies.json)."""
+    path = load_manifest().get(subject)
+    if path is not None:
+        return path
+    subject_file_name = subject.lower().replace(" ", "_")
+    return os.path.join(SUBJECTS_DIR, f"{subject_file_name}.json")
+
+
+def _compiled_bank(path, version):
+    """
+    The QuestionBank for one source file from the compiled artifact, or None
+    if there is no artifact or it was built from a different version of the
+    file. Only the artifact's header is kept between calls.
+    """
+    global _compiled
+    try:
+        file = open(COMPILED_FILE, 'rb')
+    except FileNotFoundError:
+        return None
+    with file:
+        st = os.fstat(file.fileno())
+        artifact_version = (st.st_mtime_ns, st.st_size)
+        if _compiled[0] != artifact_version:
+            header = pickle.load(file)
+            banks = header["banks"] if header.get("format") == COMPILED_FORMAT else {}
+            _compiled = (artifact_version, file.tell(), banks)
+        _, header_length, banks = _compiled
+        entry = banks.get(os.path.normpath(path))
+        if entry is None or entry[0] != version:
+            return None
+        file.seek(header_length + entry[1])
+        return pickle.loads(file.read(entry[2]))
+
+
+def _load_questions(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)["questions"]
+
+
+def get_bank(path, chapters=None):
+    """
+    Return the QuestionBank for a subject file, or None if it does not exist.
+    The file is parsed once per process and only re-read when it changes on disk.
+
+    `path` may also be a sharded subject directory, in which case only the
+    shards for `chapters` (all of them if None) are read.
+    """
+    key = path
+    try:
+        if os.path.isdir(path):
+            shards = [shard for chapter, shard in _shard_index(path) if not chapters or chapter in chapters]
+            key = (path, tuple(sorted(chapters)) if chapters else None)
+            version = tuple(_file_version(shard) for shard in shards)
+        else:
+            version = _file_version(path)
+    except FileNotFoundError:
+        with _lock:
+            _banks.pop(key, None)
+        return None
+
+    with _lock:
+        cached = _banks.get(key)
+        if cached is not None and cached[0] == version:
+            _banks.move_to_end(key)
+            return cached[1]
+
+    compiled = _compiled_bank(path, version) if key is path else None
+    if compiled is not None:
+        bank = compiled
+    elif key is not path:
+        bank = QuestionBank([q for shard in shards for q in _load_questions(shard)])
+    else:
+        # Parse outside the lock so one slow file doesn't stall other subjects
+        bank = QuestionBank(_load_questions(path))
+
+    with _lock:
+        _banks[key] = (version, bank)
+        _banks.move_to_end(key)
+        while len(_banks) > MAX_CACHED_BANKS:
+            _banks.popitem(last=False)
+    return bank
+
+
+def clear_cache():
+    global _manifest, _compiled
+    with _lock:
+        _banks.clear()
+    _manifest = (None, {})
+    _compiled = (None, 0, {})
@@ -0,0 +1,234 @@
+"""
+Keyword search and near-duplicate detection across all question banks.
+
+The index is an inverted index from lower-cased terms to questions, built
+over question text, options, chapter and topic. It is split into one segment
+per subject bank; refresh() only rebuilds the segments whose bank changed
+on disk, so an edit to one subject file doesn't reindex the rest.
+
+Queries AND their terms together and treat the last term as a prefix, so
+results update as a tutor types. Each segment keeps its vocabulary sorted
+for the prefix lookups.
+
+Sharded (bulk imported) subjects are large and otherwise only read a
+chapter at a time, so they are left out unless a search names them in
+`subjects`.
+
+near_duplicates() compares MinHash signatures of word shingles, bucketed
+with LSH bands so only likely pairs are compared, and reports pairs whose
+estimated Jaccard similarity is above a threshold, including across banks:
+
+    python search_index.py duplicates --threshold 0.8
+    python search_index.py search "identify the verb"
+"""
+import argparse
+import hashlib
+import os
+import re
+import threading
+from bisect import bisect_left
+from random import Random
+
+import question_bank
+
+# Word characters plus the Indic blocks, whose vowel signs \w doesn't cover
+TOKEN_RE = re.compile(r"[\w\u0900-\u0DFF]+")
+
+SHINGLE_SIZE = 3
+MINHASH_PERMUTATIONS = 32
+LSH_BANDS = 8
+_MASKS = [Random(i).getrandbits(64) for i in range(MINHASH_PERMUTATIONS)]
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(str(text).lower())
+
+
+def _hash64(text):
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def minhash(text):
+    """MinHash signature of the word shingles in `text`."""
+    words = tokenize(text)
+    shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(1, len(words) - SHINGLE_SIZE + 1))}
+    hashes = [_hash64(s) for s in shingles]
+    return tuple(min(h ^ mask for h in hashes) for mask in _MASKS)
+
+
+def _dedupe_text(q):
+    options = q.get("options", [])
+    return " ".join([q.get("question", "")] + [str(o) for o in options if isinstance(options, (list, tuple))])
+
+
+class _Segment:
+    """Index over one subject bank."""
+
+    def __init__(self, subject, bank):
+        self.subject = subject
+        self.bank = bank
+        self.questions = bank.questions
+        self.postings = {}
+        for doc, q in enumerate(self.questions):
+            options = q.get("options", [])
+            text = " ".join([q.get("question", ""), q.get("chapter", ""), q.get("topic", "")]
+                            + ([str(o) for o in options] if isinstance(options, (list, tuple)) else []))
+            for term in set(tokenize(text)):
+                self.postings.setdefault(term, []).append(doc)
+        self.terms = sorted(self.postings)
+        self._signatures = None
+
+    def docs_for_prefix(self, prefix):
+        docs = set()
+        i = bisect_left(self.terms, prefix)
+        while i < len(self.terms) and self.terms[i].startswith(prefix):
+            docs.update(self.postings[self.terms[i]])
+            i += 1
+        return docs
+
+    def search(self, terms, chapter=None, topic=None):
+        """Doc numbers matching every term, with the last one as a prefix."""
+        if not terms:
+            docs = set(range(len(self.questions)))
+        else:
+            *exact, prefix = terms
+            sets = [set(self.postings.get(t, ())) for t in exact]
+            sets.append(self.docs_for_prefix(prefix))
+            sets.sort(key=len)
+            docs = sets[0].intersection(*sets[1:])
+        if chapter:
+            docs = {d for d in docs if self.questions[d].get("chapter") == chapter}
+        if topic:
+            docs = {d for d in docs if self.questions[d].get("topic") == topic}
+        return sorted(docs)
+
+    def signatures(self):
+        if self._signatures is None:
+            self._signatures = [minhash(_dedupe_text(q)) for q in self.questions]
+        return self._signatures
+
+
+class SearchIndex:
+    def __init__(self):
+        self._segments = {}
+        self._lock = threading.Lock()
+
+    def refresh(self, subjects=None):
+        """
+        Rebuild segments for banks that changed since the last refresh and drop
+        removed subjects. Only `subjects` are refreshed if given; otherwise every
+        subject except sharded ones. Returns the subjects that can be searched.
+        """
+        manifest = question_bank.load_manifest()
+        searchable = []
+        for subject, path in manifest.items():
+            if subjects is not None and subject not in subjects:
+                continue
+            if subjects is None and os.path.isdir(path):
+                continue
+            bank = question_bank.get_bank(path)
+            segment = self._segments.get(subject)
+            if bank is None:
+                self._segments.pop(subject, None)
+                continue
+            if segment is None or segment.bank is not bank:
+                built = _Segment(subject, bank)
+                with self._lock:
+                    self._segments[subject] = built
+            searchable.append(subject)
+        for subject in set(self._segments) - set(manifest):
+            self._segments.pop(subject, None)
+        return searchable
+
+    def search(self, query, subjects=None, chapter=None, topic=None, limit=50):
+        """
+        Return up to `limit` (subject, question) pairs matching the query,
+        optionally restricted to some subjects, a chapter and a topic.
+        An empty query lists everything that passes the filters. Sharded
+        subjects are only searched when listed in `subjects`.
+        """
+        terms = tokenize(query)
+        results = []
+        for subject in self.refresh(subjects):
+            segment = self._segments.get(subject)
+            if segment is None:
+                continue
+            for doc in segment.search(terms, chapter=chapter, topic=topic):
+                results.append((subject, segment.questions[doc]))
+                if len(results) >= limit:
+                    return results
+        return results
+
+    def near_duplicates(self, threshold=0.8, subjects=None):
+        """
+        Return [(similarity, (subject, id), (subject, id))] for question pairs whose
+        estimated Jaccard similarity is at least `threshold`, most similar first.
+        """
+        rows = MINHASH_PERMUTATIONS // LSH_BANDS
+        buckets = {}
+        entries = []
+        for subject in self.refresh(subjects):
+            segment = self._segments.get(subject)
+            if segment is None:
+                continue
+            for q, signature in zip(segment.questions, segment.signatures()):
+                entry = len(entries)
+                entries.append((subject, q.get("id"), signature))
+                for band in range(LSH_BANDS):
+                    key = (band, signature[band * rows:(band + 1) * rows])
+                    buckets.setdefault(key, []).append(entry)
+
+        pairs = set()
+        for members in buckets.values():
+            for i in range(len(members)):
+                for j in range(i + 1, len(members)):
+                    pairs.add((members[i], members[j]))
+
+        report = []
+        for a, b in pairs:
+            sig_a, sig_b = entries[a][2], entries[b][2]
+            similarity = sum(x == y for x, y in zip(sig_a, sig_b)) / MINHASH_PERMUTATIONS
+            if similarity >= threshold:
+                report.append((similarity, entries[a][:2], entries[b][:2]))
+        report.sort(key=lambda r: r[0], reverse=True)
+        return report
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Return the process-wide SearchIndex."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SearchIndex()
+        return _index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search the question banks")
+    sub = parser.add_subparsers(dest="command", required=True)
+    find = sub.add_parser("search", help="Print questions matching a query")
+    find.add_argument("query")
+    find.add_argument("--subject", action="append", help="Limit to a subject (repeatable)")
+    find.add_argument("--limit", type=int, default=20)
+    dupes = sub.add_parser("duplicates", help="Report near-duplicate questions")
+    dupes.add_argument("--threshold", type=float, default=0.8)
+    dupes.add_argument("--subject", action="append", help="Limit to a subject (repeatable)")
+    args = parser.parse_args()
+
+    index = get_index()
+    if args.command == "search":
+        for subject, q in index.search(args.query, subjects=args.subject, limit=args.limit):
+            print(f"{subject}\t{q['id']}\t{q.get('question', '')}")
+    elif args.command == "duplicates":
+        report = index.near_duplicates(args.threshold, subjects=args.subject)
+        for similarity, (subject_a, id_a), (subject_b, id_b) in report:
+            print(f"{similarity:.2f}\t{subject_a}/{id_a}\t{subject_b}/{id_b}")
+        print(f"{len(report)} near-duplicate pairs at threshold {args.threshold}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""
+Next-question selection for one (user, subject).
+
+A QuestionSelector is built once from the user's progress and then kept up
+to date as answers come in, so picking the next question never rescans the
+subject. Questions sit in three buckets (unseen, incorrect, correct) that
+support O(1) move/random pick, and correctly answered questions are
+scheduled for review with Leitner boxes, each a queue ordered by due time.
+State is kept per question position in flat arrays and bitsets, so a
+selector costs a few bytes per question in each session.
+
+Policies:
+    "leitner"  - incorrect first, then due reviews mixed with unseen questions
+    "priority" - incorrect first, then unseen (the original get_next_question)
+    "fancy"    - 80% incorrect, 30% already-correct, otherwise unseen
+                 (the original get_next_question_fancy)
+"""
+import random
+import time
+from array import array
+
+DAY = 24 * 60 * 60
+
+# Review interval for each Leitner box; box 0 holds incorrect answers
+LEITNER_INTERVALS = [0, 1 * DAY, 3 * DAY, 7 * DAY, 16 * DAY, 35 * DAY]
+MASTERED_BOX = len(LEITNER_INTERVALS) - 1
+
+# Share of picks that go to a due review when unseen questions are also left
+REVIEW_SHARE = 0.5
+
+POLICIES = ("leitner", "priority", "fancy")
+
+
+def schedule(box, correct, now):
+    """Return (box, due) after answering a question currently in `box`."""
+    box = min(box + 1, MASTERED_BOX) if correct else 0
+    return box, now + LEITNER_INTERVALS[box]
+
+
+# Buckets a question can be in; RETIRED is only used while planning a session
+UNSEEN, INCORRECT, CORRECT, RETIRED = 0, 1, 2, 3
+
+
+def _index_typecode(size):
+    return 'H' if size <= 0xFFFF else 'I'
+
+
+class Bitset:
+    """Fixed-size set of small integers, one bit each."""
+
+    __slots__ = ("_bits",)
+
+    def __init__(self, size):
+        self._bits = bytearray((size + 7) >> 3)
+
+    def __getitem__(self, i):
+        return bool(self._bits[i >> 3] & (1 << (i & 7)))
+
+    def set(self, i, value=True):
+        if value:
+            self._bits[i >> 3] |= 1 << (i & 7)
+        else:
+            self._bits[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+
+    def copy(self):
+        other = Bitset(0)
+        other._bits = bytearray(self._bits)
+        return other
+
+
+class IndexBuckets:
+    """
+    The integers 0..size-1 split into buckets, all starting in bucket 0,
+    with O(1) move and uniform random choice. Everything lives in flat
+    arrays: a few bytes per question instead of a dict entry per bucket.
+    """
+
+    __slots__ = ("_items", "_pos")
+
+    def __init__(self, size, buckets):
+        typecode = _index_typecode(size)
+        self._items = [array(typecode, range(size))] + [array(typecode) for _ in range(buckets - 1)]
+        self._pos = array(typecode, range(size))
+
+    def move(self, i, source, target):
+        items = self._items[source]
+        pos = self._pos[i]
+        last = items.pop()
+        if pos < len(items):
+            items[pos] = last
+            self._pos[last] = pos
+        self._pos[i] = len(self._items[target])
+        self._items[target].append(i)
+
+    def size(self, bucket):
+        return len(self._items[bucket])
+
+    def choice(self, bucket, rng=random):
+        items = self._items[bucket]
+        return items[rng.randrange(len(items))]
+
+    def members(self, bucket):
+        return self._items[bucket]
+
+    def copy(self):
+        other = IndexBuckets(0, 0)
+        other._items = [items[:] for items in self._items]
+        other._pos = self._pos[:]
+        return other
+
+
+class ReviewQueues:
+    """
+    Correctly answered questions ordered by due time, one FIFO per Leitner
+    box. Answers only move forward in time and every question in a box gets
+    the same interval, so appending keeps each box sorted by due time and the
+    earliest due review is at the head of one of the boxes. Entries pack
+    (due seconds, position) into one 64-bit integer. Superseded entries stay
+    put and are skipped when they reach the head.
+    """
+
+    __slots__ = ("_queues", "_heads")
+
+    def __init__(self):
+        self._queues = [array('Q') for _ in LEITNER_INTERVALS]
+        self._heads = [0] * len(LEITNER_INTERVALS)
+
+    @staticmethod
+    def _pack(due, i):
+        return (int(due) << 32) | i
+
+    def copy(self):
+        other = ReviewQueues()
+        other._queues = [queue[:] for queue in self._queues]
+        other._heads = list(self._heads)
+        return other
+
+    def push(self, box, due, i):
+        self._queues[box].append(self._pack(due, i))
+
+    def peek(self, is_current):
+        """(due, i) of the earliest entry still current per is_current(box, due, i), or None."""
+        best = None
+        for box, queue in enumerate(self._queues):
+            head = self._heads[box]
+            while head < len(queue):
+                due, i = queue[head] >> 32, queue[head] & 0xFFFFFFFF
+                if is_current(box, due, i):
+                    if best is None or due < best[0]:
+                        best = (due, i)
+                    break
+                head += 1
+            # Drop the skipped prefix once it is half the queue
+            if head > 32 and head * 2 > len(queue):
+                del queue[:head]
+                head = 0
+            self._heads[box] = head
+        return best
+
+
+class QuestionSelector:
+    def __init__(self, question_ids, subject_progress=None, policy="leitner", index=None):
+        """
+        question_ids: every id in the subject bank, in bank order. Pass the
+        bank's own QuestionBank.ids and QuestionBank.index ({id: position})
+        so sessions share them; otherwise an index is built here.
+        subject_progress: progress[subject] as returned by load_user_progress,
+        i.e. {"attempted": {id: bool}, "review": {id: [box, due]}}.
+
+        Internally questions are positions in question_ids: which have been
+        attempted and answered correctly are bitsets, and Leitner boxes and
+        due times are flat arrays.
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown selection policy '{policy}'")
+        self.policy = policy
+        self.ids = question_ids if isinstance(question_ids, (tuple, list)) else tuple(question_ids)
+        self.index = index if index is not None else {qid: i for i, qid in enumerate(self.ids)}
+        subject_progress = subject_progress or {}
+        review = subject_progress.get("review", {})
+
+        size = len(self.ids)
+        self.attempted = Bitset(size)
+        self.correct = Bitset(size)
+        self._buckets = IndexBuckets(size, 4)
+        self._retired = None
+        self._box = bytearray(size)
+        self._due = array('I', bytes(4 * size))  # whole seconds
+        self._reviews = ReviewQueues()
+        self.last = -1
+        scheduled = []
+
+        for qid, was_correct in subject_progress.get("attempted", {}).items():
+            i = self.index.get(qid)
+            if i is None:
+                continue  # no longer in the bank
+            self.attempted.set(i)
+            if was_correct:
+                self.correct.set(i)
+                self._buckets.move(i, UNSEEN, CORRECT)
+                # Answers recorded before scheduling existed start in box 1, due now
+                box, due = review.get(qid, (1, 0))
+                self._box[i] = box
+                self._due[i] = int(due)
+                scheduled.append(i)
+            else:
+                self._buckets.move(i, UNSEEN, INCORRECT)
+        for i in sorted(scheduled, key=self._due.__getitem__):
+            self._reviews.push(self._box[i], self._due[i], i)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _bucket(self, i):
+        if self._retired is not None and self._retired[i]:
+            return RETIRED
+        if not self.attempted[i]:
+            return UNSEEN
+        return CORRECT if self.correct[i] else INCORRECT
+
+    @property
+    def mastered(self):
+        return [self.ids[i] for i in self._buckets.members(CORRECT) if self._box[i] == MASTERED_BOX]
+
+    def _is_current(self, box, due, i):
+        return self._bucket(i) == CORRECT and self._box[i] == box and self._due[i] == due
+
+    def _peek_due(self, now):
+        earliest = self._reviews.peek(self._is_current)
+        return earliest[1] if earliest is not None and earliest[0] <= now else None
+
+    def next(self, rng=random, now=None):
+        """Return (question_id, is_review) for the next question, or None when done."""
+        picked = self.next_index(rng, now)
+        return None if picked is None else (self.ids[picked[0]], picked[1])
+
+    def next_index(self, rng=random, now=None):
+        """Like next(), with the question's position in question_ids instead of its id."""
+        now = time.time() if now is None else now
+        buckets = self._buckets
+        if self.policy == "priority":
+            if buckets.size(INCORRECT):
+                return buckets.choice(INCORRECT, rng), False
+            if buckets.size(UNSEEN):
+                return buckets.choice(UNSEEN, rng), False
+            return None
+
+        if self.policy == "fancy":
+            random_number = rng.randint(1, 10)
+            if buckets.size(INCORRECT) and rng.random() < 0.8:
+                return buckets.choice(INCORRECT, rng), False
+            if random_number <= 3 and buckets.size(CORRECT):
+                return buckets.choice(CORRECT, rng), True
+            if buckets.size(UNSEEN):
+                return buckets.choice(UNSEEN, rng), False
+            return None
+
+        due = self._peek_due(now)
+        if buckets.size(INCORRECT):
+            i = buckets.choice(INCORRECT, rng)
+            # Don't repeat a question straight after getting it wrong if there is anything else
+            if i != self.last or (due is None and not buckets.size(UNSEEN)):
+                return i, False
+        if due is not None and (not buckets.size(UNSEEN) or rng.random() < REVIEW_SHARE):
+            return due, True
+        if buckets.size(UNSEEN):
+            return buckets.choice(UNSEEN, rng), False
+        return None
+
+    def plan(self, count, rng=random, now=None):
+        """
+        (position, is_review) for the next `count` questions in the order this
+        policy would ask them, without repeats. Runs on a copy; this selector
+        is unchanged. Fewer are returned if the subject runs out.
+        """
+        sim = self._copy()
+        sim._retired = Bitset(len(self.ids))
+        picks = []
+        while len(picks) < count:
+            picked = sim.next_index(rng, now)
+            if picked is None:
+                break
+            i = picked[0]
+            sim._buckets.move(i, sim._bucket(i), RETIRED)
+            sim._retired.set(i)
+            picks.append(picked)
+        return picks
+
+    def _copy(self):
+        other = QuestionSelector.__new__(QuestionSelector)
+        other.policy = self.policy
+        other.ids = self.ids
+        other.index = self.index
+        other.attempted = self.attempted.copy()
+        other.correct = self.correct.copy()
+        other._buckets = self._buckets.copy()
+        other._retired = None
+        other._box = bytearray(self._box)
+        other._due = self._due[:]
+        other._reviews = self._reviews.copy()
+        other.last = self.last
+        return other
+
+    def record(self, qid, correct, now=None):
+        """Update the buckets and schedule after an answer. Returns the new (box, due)."""
+        return self.record_index(self.index[qid], correct, now)
+
+    def record_index(self, i, correct, now=None):
+        now = time.time() if now is None else now
+        box, due = schedule(self._box[i], correct, now)
+        self._box[i] = box
+        self._due[i] = int(due)
+        self.last = i
+        source = self._bucket(i)
+        target = CORRECT if correct else INCORRECT
+        if source != target:
+            self._buckets.move(i, source, target)
+        self.attempted.set(i)
+        self.correct.set(i, correct)
+        if correct:
+            self._reviews.push(box, due, i)
+        return box, due
@@ -0,0 +1,108 @@
+"""
+Whole-session question plans.
+
+When a student presses "Start Learning" the selector picks every question
+for the session in one pass (QuestionSelector.plan) and each question's
+options are shuffled once. The plan lives in session state as a few packed
+arrays, so moving to the next question is just a cursor increment: no
+reselection and no progress reload. Each planned question also remembers
+whether it is a review of one already answered correctly, which doesn't score.
+
+With AVANI_PREFETCH=1 the whole plan is also handed to a small browser
+component (components/session_player/index.html) that shows the next
+question the moment an answer is given. Each answer is sent back to the
+server, which checks and records it as usual; the component only decides
+what to show. Note that this mode sends the answers to the browser so it
+can show feedback straight away.
+"""
+import os
+import random
+from array import array
+
+PREFETCH = os.environ.get("AVANI_PREFETCH") == "1"
+COMPONENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "components", "session_player")
+
+
+class SessionPlan:
+    """
+    The questions of one session, in order. positions index into the subject
+    bank; reviews has one byte per question, 1 for reviews; orders holds each
+    question's option order, one byte per option, with offsets marking where
+    each question's slice ends.
+    """
+
+    __slots__ = ("subject", "ids", "positions", "reviews", "orders", "offsets", "cursor")
+
+    def __init__(self, subject, ids, positions, reviews, orders, offsets):
+        self.subject = subject
+        self.ids = ids  # the bank's shared id table, to notice when the bank is reloaded
+        self.positions = positions
+        self.reviews = reviews
+        self.orders = orders
+        self.offsets = offsets
+        self.cursor = 0
+
+    def __len__(self):
+        return len(self.positions)
+
+    def matches(self, bank):
+        return bank is not None and bank.ids is self.ids
+
+    @property
+    def done(self):
+        return self.cursor >= len(self.positions)
+
+    def current(self):
+        """Bank position of the question being asked, or None once the plan is used up."""
+        return None if self.done else self.positions[self.cursor]
+
+    def is_review(self, k=None):
+        """True if the k-th planned question (default: the current one) is a review."""
+        return bool(self.reviews[self.cursor if k is None else k])
+
+    def options(self, bank, k=None):
+        """Options of the k-th planned question (default: the current one) in their shuffled order."""
+        k = self.cursor if k is None else k
+        start = self.offsets[k - 1] if k else 0
+        options = bank.questions[self.positions[k]]['options']
+        return [options[j] for j in self.orders[start:self.offsets[k]]]
+
+    def advance(self):
+        self.cursor += 1
+
+
+def make_plan(subject, bank, selector, count, rng=random):
+    """Plan up to `count` questions with the selector's policy and shuffle their options."""
+    picks = selector.plan(count, rng)
+    positions = [i for i, _ in picks]
+    reviews = bytearray(is_review for _, is_review in picks)
+    orders = array('B')
+    offsets = array('H')
+    for i in positions:
+        order = list(range(len(bank.questions[i]['options'])))
+        rng.shuffle(order)
+        orders.extend(order)
+        offsets.append(len(orders))
+    typecode = 'H' if len(bank.questions) <= 0xFFFF else 'I'
+    return SessionPlan(subject, bank.ids, array(typecode, positions), reviews, orders, offsets)
+
+
+_player = None
+
+
+def player(plan, bank, key=None):
+    """
+    Render the prefetching question player for the rest of the plan. Returns
+    the component's value: {"answers": [[plan index, choice, latency], ...]},
+    every answer given in this plan so far, or None before the first one.
+    """
+    global _player
+    if _player is None:
+        import streamlit.components.v1 as components
+        _player = components.declare_component("session_player", path=COMPONENT_DIR)
+    questions = [{"chapter": bank.questions[i].get('chapter', 'Unknown Chapter'),
+                  "question": bank.questions[i]['question'],
+                  "options": plan.options(bank, k),
+                  "answer": bank.questions[i]['answer']}
+                 for k, i in enumerate(plan.positions)]
+    return _player(questions=questions, start=plan.cursor, key=key, default=None)
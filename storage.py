@@ -0,0 +1,224 @@
+"""
+User and score storage backends.
+
+The JSON backend keeps everything in data/users.json and is fine for a
+handful of users. The SQLite backend (WAL mode) stores one row per
+(user, subject) score so that a correct answer is a single atomic upsert
+instead of a rewrite of every user's record.
+
+Pick a backend with the AVANI_STORAGE environment variable ("json" or
+"sqlite"); AVANI_DB overrides the SQLite file location.
+
+To move an existing install over to SQLite:
+
+    python storage.py import ./data/users.json ./data/avani.db
+"""
+import argparse
+import os
+import sqlite3
+import threading
+from contextlib import nullcontext
+
+import atomic_io
+
+USERS_FILE = './data/users.json'
+DB_FILE = './data/avani.db'
+
+
+class JsonUserStore:
+    """
+    Users, roles and scores in a single users.json file. Writes are atomic
+    and serialised across processes (see atomic_io.py); reads never block.
+    """
+
+    def __init__(self, path=USERS_FILE):
+        self.path = path
+
+    def load_users(self):
+        return self.load_users_versioned()[0]
+
+    def load_users_versioned(self):
+        """Return (users, version); pass the version to save_users to detect lost updates."""
+        data, version = atomic_io.read_json_versioned(self.path, {"users": []})
+        return data["users"], version
+
+    def save_users(self, users, version=None):
+        """Replace all users. With a version, raise atomic_io.VersionConflict if the file changed since."""
+        if version is None:
+            atomic_io.write_json(self.path, {"users": users}, indent=4)
+        else:
+            atomic_io.write_json_if_unchanged(self.path, {"users": users}, version, indent=4)
+
+    def get_user(self, username):
+        return next((u for u in self.load_users() if u['username'] == username), None)
+
+    def is_tutor(self, username):
+        user = self.get_user(username)
+        return user is not None and user.get("role", "").lower() == "tutor"
+
+    def increment_score(self, username, subject, delta=1):
+        def add(data):
+            for u in data["users"]:
+                if u['username'] == username:
+                    u.setdefault('scores', {})
+                    u['scores'][subject] = u['scores'].get(subject, 0) + delta
+                    break
+            return data
+
+        # Locked read-modify-write, so concurrent increments are never lost
+        atomic_io.update_json(self.path, add, {"users": []}, indent=4)
+
+    def increment_scores(self, deltas, commit=None):
+        """
+        Apply {(username, subject): delta} in one locked rewrite of the file.
+        `commit` is entered around the moment the new file replaces the old one.
+        """
+        def add(data):
+            by_name = {u['username']: u for u in data["users"]}
+            for (username, subject), delta in deltas.items():
+                user = by_name.get(username)
+                if user is not None:
+                    scores = user.setdefault('scores', {})
+                    scores[subject] = scores.get(subject, 0) + delta
+            return data
+
+        atomic_io.update_json(self.path, add, {"users": []}, commit=commit, indent=4)
+
+
+class SqliteUserStore:
+    """Users, roles and scores in a SQLite database running in WAL mode."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            role     TEXT NOT NULL DEFAULT 'student',
+            position INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS scores (
+            username TEXT NOT NULL REFERENCES users(username),
+            subject  TEXT NOT NULL,
+            points   INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (username, subject)
+        );
+    """
+
+    def __init__(self, path=DB_FILE):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self):
+        # sqlite3 connections can't be shared across threads, and Streamlit
+        # runs each session's script in its own thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load_users(self):
+        conn = self._connect()
+        users = []
+        by_name = {}
+        for username, role in conn.execute("SELECT username, role FROM users ORDER BY position, username"):
+            user = {"username": username, "role": role, "scores": {}}
+            users.append(user)
+            by_name[username] = user
+        for username, subject, points in conn.execute("SELECT username, subject, points FROM scores"):
+            if username in by_name:
+                by_name[username]["scores"][subject] = points
+        return users
+
+    def save_users(self, users, version=None):
+        # Runs in one transaction, so readers see all or nothing; version is accepted for
+        # parity with JsonUserStore
+        with self._connect() as conn:
+            conn.execute("DELETE FROM scores")
+            conn.execute("DELETE FROM users")
+            for position, u in enumerate(users):
+                conn.execute("INSERT INTO users (username, role, position) VALUES (?, ?, ?)",
+                             (u['username'], u.get('role', 'student'), position))
+                conn.executemany("INSERT INTO scores (username, subject, points) VALUES (?, ?, ?)",
+                                 [(u['username'], s, p) for s, p in u.get('scores', {}).items()])
+
+    def get_user(self, username):
+        conn = self._connect()
+        row = conn.execute("SELECT role FROM users WHERE username = ?", (username,)).fetchone()
+        if row is None:
+            return None
+        scores = dict(conn.execute("SELECT subject, points FROM scores WHERE username = ?", (username,)))
+        return {"username": username, "role": row[0], "scores": scores}
+
+    def is_tutor(self, username):
+        row = self._connect().execute("SELECT role FROM users WHERE username = ?", (username,)).fetchone()
+        return row is not None and (row[0] or "").lower() == "tutor"
+
+    def increment_score(self, username, subject, delta=1):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO scores (username, subject, points) VALUES (?, ?, ?) "
+                "ON CONFLICT (username, subject) DO UPDATE SET points = points + excluded.points",
+                (username, subject, delta))
+
+    def increment_scores(self, deltas, commit=None):
+        """
+        Apply {(username, subject): delta} in one transaction. `commit` is
+        entered around the COMMIT, when other connections start seeing it.
+        """
+        conn = self._connect()
+        try:
+            conn.executemany(
+                "INSERT INTO scores (username, subject, points) VALUES (?, ?, ?) "
+                "ON CONFLICT (username, subject) DO UPDATE SET points = points + excluded.points",
+                [(username, subject, delta) for (username, subject), delta in deltas.items()])
+        except BaseException:
+            conn.rollback()
+            raise
+        with commit() if commit is not None else nullcontext():
+            conn.commit()
+
+
+def import_users_json(json_path, db_path):
+    """One-shot copy of a users.json file into a SQLite store. Returns the number of users."""
+    users = JsonUserStore(json_path).load_users()
+    SqliteUserStore(db_path).save_users(users)
+    return len(users)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_user_store():
+    """Return the process-wide user store selected by AVANI_STORAGE."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            backend = os.environ.get("AVANI_STORAGE", "json").lower()
+            if backend == "sqlite":
+                _store = SqliteUserStore(os.environ.get("AVANI_DB", DB_FILE))
+            elif backend == "json":
+                _store = JsonUserStore(USERS_FILE)
+            else:
+                raise ValueError(f"Unknown AVANI_STORAGE backend '{backend}'")
+        return _store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Avani Academy storage tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="Import users.json into a SQLite database")
+    imp.add_argument("json_path", nargs="?", default=USERS_FILE)
+    imp.add_argument("db_path", nargs="?", default=DB_FILE)
+    args = parser.parse_args()
+
+    if args.command == "import":
+        count = import_users_json(args.json_path, args.db_path)
+        print(f"Imported {count} users from {args.json_path} into {args.db_path}")
+
+
+if __name__ == "__main__":
+    main()
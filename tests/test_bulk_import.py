@@ -0,0 +1,61 @@
+import io
+import json
+
+import pytest
+
+import bulk_import
+import question_bank
+
+
+@pytest.fixture
+def subjects_dir(tmp_path, monkeypatch):
+    directory = tmp_path / "subjects"
+    directory.mkdir()
+    monkeypatch.setattr(question_bank, "SUBJECTS_DIR", str(directory) + "/")
+    monkeypatch.setattr(question_bank, "MANIFEST_FILE", str(directory / "manifest.json"))
+    question_bank.clear_cache()
+    yield directory
+    question_bank.clear_cache()
+
+
+def _question(qid, chapter="C1"):
+    return {"id": qid, "chapter": chapter, "topic": "T", "question": f"Question {qid}?",
+            "options": ["a", "b"], "answer": "a"}
+
+
+def test_jsonl_bad_rows_are_reported_not_raised(subjects_dir):
+    lines = [
+        json.dumps(_question("q1")),
+        "[1, 2]",
+        '"x"',
+        "null",
+        "{not json",
+        json.dumps({"id": "q2", "chapter": "C1"}),
+        json.dumps(_question("q1")),
+        json.dumps(_question("q3", chapter="C2")),
+    ]
+    result = bulk_import.import_questions(io.StringIO("\n".join(lines) + "\n"), "Science", "jsonl")
+
+    assert (result.imported, result.duplicates, result.invalid, result.chapters) == (2, 1, 5, 2)
+    assert [e.split(":")[0] for e in result.errors] == ["line 2", "line 3", "line 4", "line 5", "line 6"]
+    assert "got list" in result.errors[0]
+    assert "q2: missing 'question'" in result.errors[4]
+    bank = question_bank.get_bank(question_bank.subject_file("Science"))
+    assert sorted(q["id"] for q in bank.questions) == ["q1", "q3"]
+
+
+def test_csv_bad_rows_are_reported_not_raised(subjects_dir):
+    rows = ("id,chapter,topic,question,options,answer\n"
+            "q1,C1,T,Question one?,a|b,a\n"
+            "q2,C1,T,Question two?,[broken,a\n"
+            "q3,C1,T,Question three?,a|b,c\n"
+            "q4,C1\n"
+            "q5,C1,T,Question five?,only,only\n")
+    result = bulk_import.import_questions(io.StringIO(rows), "Science", "csv", dry_run=True)
+
+    assert (result.imported, result.invalid) == (1, 4)
+    assert [e.split(":")[0] for e in result.errors] == ["line 3", "line 4", "line 5", "line 6"]
+    assert "'options' must be a list" in result.errors[0]
+    assert "answer 'c' is not one of the options" in result.errors[1]
+    # A dry run publishes nothing
+    assert "Science" not in question_bank.load_manifest()
@@ -0,0 +1,50 @@
+import threading
+import time
+
+import pytest
+
+import progress_log
+
+
+@pytest.fixture
+def progress_dir(tmp_path, monkeypatch):
+    directory = tmp_path / "user_progress"
+    directory.mkdir()
+    monkeypatch.setattr(progress_log, "USER_PROGRESS_DIR", str(directory) + "/")
+    # Compact every few attempts so readers keep running into compactions
+    monkeypatch.setattr(progress_log, "COMPACT_BYTES", 512)
+    return directory
+
+
+def test_readers_never_miss_attempts_during_compaction(progress_dir):
+    total = 1000
+    written = []
+    problems = []
+    done = threading.Event()
+
+    def writer():
+        try:
+            for i in range(total):
+                progress_log.record_attempt("a", "S", f"q{i}", True)
+                written.append(i)
+        finally:
+            done.set()
+
+    def reader():
+        while not done.is_set():
+            at_least = len(written)
+            attempted = progress_log.load_progress("a").get("S", {}).get("attempted", {})
+            if len(attempted) < at_least:
+                problems.append((at_least, len(attempted)))
+            time.sleep(0.001)  # a student's reruns, not a busy loop holding off compaction
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert problems == []
+    assert len(progress_log.load_progress("a")["S"]["attempted"]) == total
+    assert [e["question_id"] for e in progress_log.iter_history("a")] == [f"q{i}" for i in range(total)]
+    assert list((progress_dir / "history" / "a").iterdir()), "compaction ran"
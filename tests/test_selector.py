@@ -0,0 +1,137 @@
+import random
+
+import pytest
+
+from selector import DAY, LEITNER_INTERVALS, POLICIES, IndexBuckets, QuestionSelector, ReviewQueues
+
+
+def _ids(n):
+    return [f"q{i}" for i in range(n)]
+
+
+def test_index_buckets_move_keeps_positions_consistent():
+    rng = random.Random(0)
+    buckets = IndexBuckets(200, 3)
+    expected = [set(range(200)), set(), set()]
+    where = [0] * 200
+    for _ in range(2000):
+        i = rng.randrange(200)
+        target = rng.choice([b for b in range(3) if b != where[i]])
+        buckets.move(i, where[i], target)
+        expected[where[i]].discard(i)
+        expected[target].add(i)
+        where[i] = target
+
+        for b in range(3):
+            members = buckets.members(b)
+            assert sorted(members) == sorted(expected[b])
+            assert buckets.size(b) == len(expected[b])
+            # Every member knows its own slot, which is what the swap-remove relies on
+            assert all(buckets._pos[m] == k for k, m in enumerate(members))
+
+
+def test_index_buckets_move_last_and_only_member():
+    buckets = IndexBuckets(3, 2)
+    buckets.move(2, 0, 1)  # the last slot: nothing to swap in
+    assert sorted(buckets.members(0)) == [0, 1]
+    buckets.move(0, 0, 1)
+    buckets.move(1, 0, 1)  # the only member left
+    assert buckets.size(0) == 0
+    assert sorted(buckets.members(1)) == [0, 1, 2]
+    assert buckets.choice(1, random.Random(0)) in (0, 1, 2)
+
+
+def test_review_queues_peek_returns_earliest_due_across_boxes():
+    queues = ReviewQueues()
+    # Each box gets entries in due order, as record() produces them
+    queues.push(1, 100, 0)
+    queues.push(1, 300, 1)
+    queues.push(2, 50, 2)
+    queues.push(2, 400, 3)
+    live = {0, 1, 2, 3}
+
+    def current(box, due, i):
+        return i in live
+
+    order = []
+    while True:
+        earliest = queues.peek(current)
+        if earliest is None:
+            break
+        order.append(earliest)
+        live.discard(earliest[1])
+    assert order == [(50, 2), (100, 0), (300, 1), (400, 3)]
+
+
+def test_review_queues_skip_superseded_entries_and_compact():
+    queues = ReviewQueues()
+    for i in range(100):
+        queues.push(1, i, i)
+    stale = set(range(70))
+    assert queues.peek(lambda box, due, i: i not in stale) == (70, 70)
+    # The skipped prefix was dropped once it passed half the queue
+    assert queues._heads[1] == 0
+    assert len(queues._queues[1]) == 30
+    assert queues.peek(lambda box, due, i: i not in stale) == (70, 70)
+
+
+def test_selector_asks_due_reviews_in_due_order():
+    ids = _ids(6)
+    selector = QuestionSelector(ids, policy="leitner")
+    # Answer every question correctly at different times; each lands in box 1
+    for k, qid in enumerate(ids):
+        selector.record(qid, True, now=k * 10)
+    # One question is answered again later and moves on to box 2
+    selector.record("q0", True, now=100)
+
+    now = 100 + LEITNER_INTERVALS[2] + 1
+    asked = []
+    for _ in range(len(ids)):
+        picked = selector.next(random.Random(0), now=now)
+        assert picked is not None and picked[1], "only reviews are left"
+        asked.append(picked[0])
+        # Answering wrong takes it out of the review queues without rescheduling it
+        selector.record(picked[0], False, now=now)
+        selector.record(picked[0], True, now=now + 10 * DAY)
+    assert asked[:5] == ["q1", "q2", "q3", "q4", "q5"]
+    assert asked[5] == "q0"
+
+
+@pytest.mark.parametrize("policy", POLICIES)
+def test_plan_never_repeats_and_leaves_selector_unchanged(policy):
+    ids = _ids(300)
+    rng = random.Random(1)
+    attempted = {qid: rng.random() < 0.6 for qid in ids if rng.random() < 0.5}
+    review = {qid: [rng.randrange(1, 6), rng.randrange(0, 10 * DAY)] for qid, ok in attempted.items() if ok}
+    selector = QuestionSelector(ids, {"attempted": attempted, "review": review}, policy=policy)
+    before = (selector._buckets._items[:], bytes(selector._box), selector._due.tobytes(), selector.last)
+
+    for count in (1, 20, 150, 1000):
+        picks = selector.plan(count, random.Random(count), now=5 * DAY)
+        positions = [i for i, _ in picks]
+        assert len(positions) == len(set(positions))
+        assert len(positions) <= count
+        for i, is_review in picks:
+            if is_review:
+                assert attempted.get(ids[i]) is True
+
+    after = (selector._buckets._items[:], bytes(selector._box), selector._due.tobytes(), selector.last)
+    assert before == after
+
+
+def test_plan_covers_whole_subject_for_priority():
+    ids = _ids(50)
+    selector = QuestionSelector(ids, {"attempted": {"q3": False, "q4": True}}, policy="priority")
+    picks = selector.plan(100, random.Random(0))
+    # priority never asks correctly answered questions again
+    assert sorted(ids[i] for i, _ in picks) == sorted(set(ids) - {"q4"})
+    assert ids[picks[0][0]] == "q3"
+
+
+def test_legacy_correct_answers_are_planned_as_reviews():
+    ids = _ids(5)
+    selector = QuestionSelector(ids, {"attempted": {"q0": True, "q1": True}}, policy="leitner")
+    picks = selector.plan(5, random.Random(0), now=DAY)
+    flags = {ids[i]: is_review for i, is_review in picks}
+    assert flags["q0"] and flags["q1"]
+    assert not any(flags[qid] for qid in ("q2", "q3", "q4"))
@@ -0,0 +1,196 @@
+import json
+import multiprocessing
+import threading
+
+import pytest
+
+import atomic_io
+import progress_log
+import storage
+import write_behind
+
+
+@pytest.fixture
+def user_store(tmp_path):
+    path = tmp_path / "users.json"
+    path.write_text(json.dumps({"users": [{"username": "a", "scores": {}}, {"username": "b", "scores": {}}]}))
+    return storage.JsonUserStore(str(path))
+
+
+@pytest.fixture
+def progress_dir(tmp_path, monkeypatch):
+    directory = tmp_path / "user_progress"
+    directory.mkdir()
+    monkeypatch.setattr(progress_log, "USER_PROGRESS_DIR", str(directory) + "/")
+    return directory
+
+
+def _attempt(username, question_id, correct=True):
+    return dict(username=username, subject="S", question_id=question_id, correct=correct)
+
+
+class FlakyProgress:
+    """progress_log, except that writes for the users in `failing` raise."""
+
+    def __init__(self, failing):
+        self.failing = set(failing)
+
+    def record_attempts(self, username, attempts, commit=None):
+        if username in self.failing:
+            raise OSError("disk full")
+        return progress_log.record_attempts(username, attempts, commit=commit)
+
+
+def _logged(username):
+    return [e["question_id"] for e in progress_log.iter_history(username)]
+
+
+def test_requeue_after_partial_failure_keeps_unwritten_attempts_in_order(user_store, progress_dir):
+    flaky = FlakyProgress({"b"})
+    writer = write_behind.WriteBehind(user_store, progress_store=flaky)
+    writer.submit({("a", "S"): 1}, [_attempt("a", "q1"), _attempt("b", "q1"), _attempt("b", "q2")])
+    with pytest.raises(OSError):
+        writer.flush()
+
+    # What was written is not queued again; what failed is
+    assert user_store.get_user("a")["scores"] == {"S": 1}
+    assert _logged("a") == ["q1"]
+    _, deltas = writer.read_scores(lambda: None)
+    assert deltas == {}
+    _, pending = writer.read_progress("b", lambda: None)
+    assert [a["question_id"] for a in pending] == ["q1", "q2"]
+
+    # Answers submitted after the failure go behind the requeued ones
+    writer.submit({}, [_attempt("b", "q3")])
+    flaky.failing.clear()
+    writer.flush()
+    assert _logged("b") == ["q1", "q2", "q3"]
+    assert _logged("a") == ["q1"]
+    assert writer.read_progress("b", lambda: None)[1] == []
+
+
+def test_requeue_after_score_failure(user_store, progress_dir):
+    writer = write_behind.WriteBehind(user_store)
+    writer.submit({("a", "S"): 2}, [_attempt("a", "q1")])
+
+    def fail(deltas, commit=None):
+        raise OSError("disk full")
+
+    user_store.increment_scores = fail
+    with pytest.raises(OSError):
+        writer.flush()
+    users, deltas = writer.read_scores(user_store.load_users)
+    assert deltas == {("a", "S"): 2}
+    assert users[0]["scores"] == {}
+
+    writer.submit({("a", "S"): 1}, [])
+    del user_store.increment_scores
+    writer.flush()
+    users, deltas = writer.read_scores(user_store.load_users)
+    assert deltas == {}
+    assert users[0]["scores"] == {"S": 3}
+    assert _logged("a") == ["q1"]
+
+
+def test_read_retries_when_a_write_lands_mid_load(user_store, progress_dir):
+    writer = write_behind.WriteBehind(user_store)
+    writer.submit({("a", "S"): 1}, [])
+    loads = []
+
+    def load():
+        # The first load races a whole flush; seeing the write and the
+        # overlay together would count the point twice
+        if not loads:
+            flusher = threading.Thread(target=writer.flush)
+            flusher.start()
+            flusher.join()
+        loads.append(1)
+        return user_store.get_user("a")
+
+    user, deltas = writer.read_scores(load)
+    assert len(loads) == 2
+    assert user["scores"].get("S", 0) + deltas.get(("a", "S"), 0) == 1
+
+
+def test_reads_do_not_wait_for_a_slow_write(user_store, progress_dir, monkeypatch):
+    writer = write_behind.WriteBehind(user_store)
+    writer.submit({("a", "S"): 1}, [])
+    writing = threading.Event()
+    release = threading.Event()
+    real_write = atomic_io.atomic_write_json
+
+    def slow_write(path, data, commit=None, **kwargs):
+        writing.set()
+        release.wait(5)  # stands in for the fsync
+        real_write(path, data, commit=commit, **kwargs)
+
+    monkeypatch.setattr(atomic_io, "atomic_write_json", slow_write)
+    flusher = threading.Thread(target=writer.flush)
+    flusher.start()
+    try:
+        assert writing.wait(5)
+        user, deltas = writer.read_scores(lambda: user_store.get_user("a"))
+        assert user["scores"].get("S", 0) + deltas.get(("a", "S"), 0) == 1
+    finally:
+        release.set()
+        flusher.join()
+    assert user_store.get_user("a")["scores"] == {"S": 1}
+
+
+class SlowCommitStore:
+    """A user store whose COMMIT blocks until released."""
+
+    def __init__(self):
+        self.points = {}
+        self.committing = threading.Event()
+        self.release = threading.Event()
+
+    def increment_scores(self, deltas, commit=None):
+        with commit():
+            self.committing.set()
+            assert self.release.wait(5)
+            for key, delta in deltas.items():
+                self.points[key] = self.points.get(key, 0) + delta
+
+
+def test_submit_does_not_wait_for_a_slow_commit(progress_dir):
+    store = SlowCommitStore()
+    writer = write_behind.WriteBehind(store)
+    writer.submit({("a", "S"): 1}, [])
+    flusher = threading.Thread(target=writer.flush)
+    flusher.start()
+    reads = []
+    reader = None
+    try:
+        assert store.committing.wait(5)
+        # Answering goes on while the write is being committed
+        writer.submit({("a", "S"): 1}, [])
+        reader = threading.Thread(target=lambda: reads.append(writer.read_scores(lambda: dict(store.points))))
+        reader.start()
+        reader.join(0.2)
+        assert reader.is_alive(), "a read overlapping the commit waits for it"
+    finally:
+        store.release.set()
+        flusher.join()
+        if reader is not None:
+            reader.join()
+    points, deltas = reads[0]
+    assert points.get(("a", "S"), 0) + deltas.get(("a", "S"), 0) == 2
+
+
+def _increment_many(path, times):
+    for _ in range(times):
+        atomic_io.update_json(path, lambda d: {"n": d["n"] + 1}, {"n": 0})
+
+
+def test_update_json_loses_no_updates_under_contention(tmp_path):
+    path = str(tmp_path / "counter.json")
+    threads = [threading.Thread(target=_increment_many, args=(path, 50)) for _ in range(4)]
+    ctx = multiprocessing.get_context("spawn")
+    processes = [ctx.Process(target=_increment_many, args=(path, 50)) for _ in range(2)]
+    for worker in threads + processes:
+        worker.start()
+    for worker in threads + processes:
+        worker.join()
+    assert all(p.exitcode == 0 for p in processes)
+    assert atomic_io.read_json(path) == {"n": 300}
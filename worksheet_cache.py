@@ -0,0 +1,119 @@
+"""
+On-disk cache of rendered worksheets, addressed by content.
+
+A worksheet is fully determined by its WorksheetSpec (see worksheets.py) and
+the version of its subject's bank file, so a rendered worksheet and answer
+key are stored under a hash of the two in data/worksheet_cache/. Editing a
+bank changes its version and makes old entries unreachable; they age out
+with the rest.
+
+Specs are also saved by their short ID in specs/, so a worksheet can be
+reprinted from nothing but its ID. Each lookup touches the entry's and its
+spec's mtime, and whenever a write takes the cache (renders and specs
+together) over its size limit the least recently used files are deleted
+first. A render whose spec has been evicted counts as a miss, so anything
+served from the cache can still be reprinted by its ID.
+
+AVANI_WORKSHEET_CACHE_MB sets the size limit (default 64).
+"""
+import hashlib
+import json
+import os
+import threading
+
+import atomic_io
+
+CACHE_DIR = './data/worksheet_cache/'
+MAX_CACHE_MB = 64
+# Part of every entry's key; bump it when rendering changes so old entries are no longer found
+ENTRY_FORMAT = 2
+
+
+class WorksheetCache:
+    def __init__(self, directory=CACHE_DIR, max_bytes=MAX_CACHE_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.specs_dir = os.path.join(directory, "specs")
+        self._lock = threading.Lock()
+        os.makedirs(self.specs_dir, exist_ok=True)
+
+    def _entry_path(self, spec_id, bank_version):
+        digest = hashlib.sha256(json.dumps([ENTRY_FORMAT, spec_id, list(bank_version)]).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def _spec_path(self, spec_id):
+        return os.path.join(self.specs_dir, f"{spec_id}.json")
+
+    def get(self, spec_id, bank_version):
+        """Return the cached {"question_ids", "worksheet", "answer_key"} entry, or None."""
+        path = self._entry_path(spec_id, bank_version)
+        try:
+            entry = atomic_io.read_json(path)
+            if entry is not None:
+                os.utime(self._spec_path(spec_id))
+                os.utime(path)
+        except (FileNotFoundError, ValueError):
+            return None
+        return entry
+
+    def put(self, spec_id, bank_version, entry):
+        atomic_io.atomic_write_json(self._entry_path(spec_id, bank_version), entry, ensure_ascii=False)
+        self._evict()
+
+    def save_spec(self, spec_id, spec_dict):
+        path = self._spec_path(spec_id)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Not evicted here: a spec is always saved just before its render's put()
+            atomic_io.atomic_write_json(path, spec_dict, ensure_ascii=False)
+
+    def load_spec(self, spec_id):
+        """The spec dict saved for a worksheet ID, or None if the ID is unknown."""
+        if not spec_id.isalnum():
+            return None
+        path = self._spec_path(spec_id)
+        spec_dict = atomic_io.read_json(path)
+        if spec_dict is not None:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass  # evicted since; the caller still gets the spec
+        return spec_dict
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            total = 0
+            for directory in (self.directory, self.specs_dir):
+                with os.scandir(directory) as it:
+                    for item in it:
+                        if item.is_file() and item.name.endswith(".json"):
+                            stat = item.stat()
+                            entries.append((stat.st_mtime_ns, stat.st_size, item.path))
+                            total += stat.st_size
+            if total <= self.max_bytes:
+                return
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass  # another process evicted it first
+                total -= size
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the process-wide WorksheetCache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            max_mb = float(os.environ.get("AVANI_WORKSHEET_CACHE_MB", MAX_CACHE_MB))
+            _cache = WorksheetCache(CACHE_DIR, int(max_mb * 1024 * 1024))
+        return _cache
@@ -0,0 +1,572 @@
+"""
+Worksheet rendering and bulk classroom worksheet generation.
+
+The batch engine gives every student on a roster their own worksheet for
+each requested subject, renders them in parallel across a process pool and
+writes one print-ready HTML file (plus a PDF when WeasyPrint is installed)
+together with a matching answer key:
+
+    python worksheets.py --subjects English Maths --seed 7 --out ./worksheets
+
+The roster defaults to every student in the user store; pass --roster to
+name students explicitly and --chapters to restrict the questions used.
+
+Single worksheets are described by a WorksheetSpec and identified by its
+short ID; rendered worksheets are kept in worksheet_cache.py, so reprinting
+an ID or re-running a batch with the same seed reuses earlier renders:
+
+    python worksheets.py --id 3f9c2a71b0de --out ./worksheets
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from html import escape
+from string import Template
+
+import question_bank
+import worksheet_cache
+
+WORKSHEET_QUESTIONS = 20
+# Questions in each of the mc_blanks layout's two sections
+MC_BLANKS_SECTION = 10
+
+# Preview pages kept in memory on top of the disk cache
+MAX_CACHED_PREVIEWS = 64
+
+
+# Print styling shared by every worksheet; emitted once per page, not per sheet
+WORKSHEET_STYLE = """
+<style>
+    @media print {
+        body {
+            font-family: Arial, sans-serif;
+        }
+        /* Only apply page break for h2 that are NOT the first one */
+        h2:not(:first-of-type) {
+            page-break-before: always;
+        }
+        .worksheet-title {
+            page-break-before: avoid !important; /* Specifically prevent page break before title */
+            page-break-after: avoid;
+            margin-top: 0;
+        }
+        .question {
+            margin-bottom: 20px;
+        }
+        hr {
+            border: 0.5px solid #ddd;
+        }
+        .options-container {
+            break-inside: avoid; /* Prevents option lists from breaking across pages */
+        }
+        .option {
+            min-width: 120px; /* Ensures options have a minimum width */
+        }
+    }
+</style>
+"""
+
+# Templates are parsed once at import; fields are escaped before substitution
+MC_QUESTION = Template(
+    "<div class='question'><p><b>Q$number. ($chapter)</b> $question</p>$options</div>")
+MC_OPTIONS = Template(
+    "<div class='options-container' style='display: flex; flex-wrap: wrap; gap: 15px; "
+    "margin-top: 10px; margin-bottom: 15px;'>$options</div>")
+MC_OPTION = Template(
+    "<div class='option'><span style='font-weight: bold;'>$letter)</span> $option</div>")
+BLANK_QUESTION = Template(
+    "<div class='question'><p><b>Q$number. ($chapter)</b> $question</p>"
+    "<p>Answer: ____________________</p></div>")
+LIST_QUESTION = Template(
+    "<hr><h3>Q$number. ($chapter)</h3>\n<p><b>$question</b></p>\n$options")
+
+PREVIEW_PAGE = Template("""<html>
+<head>
+    <style>
+        body {
+            font-family: Arial, sans-serif;
+            padding: 20px;
+        }
+        .print-button {
+            position: sticky;
+            bottom: 20px;
+            background-color: #4CAF50;
+            color: white;
+            padding: 10px 20px;
+            border: none;
+            border-radius: 4px;
+            cursor: pointer;
+            font-size: 16px;
+            margin-top: 20px;
+            z-index: 1000;
+        }
+        .print-button:hover {
+            background-color: #45a049;
+        }
+        @media print {
+            .print-button {
+                display: none;
+            }
+        }
+    </style>
+</head>
+<body>
+    $worksheet
+    <button class="print-button" onclick="window.print()">Print Worksheet</button>
+</body>
+</html>
+""")
+
+
+def _fragment_key(q):
+    options = q.get("options", [])
+    return (q.get("chapter", "Unknown Chapter"), q.get("question", ""),
+            tuple(options) if isinstance(options, (list, tuple)) else ())
+
+
+@lru_cache(maxsize=4096)
+def _mc_fragment(number, chapter, question, options):
+    options_html = ""
+    if options:
+        options_html = MC_OPTIONS.substitute(options="".join(
+            MC_OPTION.substitute(letter=chr(97 + idx), option=escape(str(opt)))  # a, b, c, d
+            for idx, opt in enumerate(options)))
+    return MC_QUESTION.substitute(number=number, chapter=escape(chapter),
+                                  question=escape(question), options=options_html)
+
+
+@lru_cache(maxsize=4096)
+def _blank_fragment(number, chapter, question, options):
+    return BLANK_QUESTION.substitute(number=number, chapter=escape(chapter), question=escape(question))
+
+
+@lru_cache(maxsize=4096)
+def _list_fragment(number, chapter, question, options):
+    if options:
+        options_html = "<ul>" + "".join(f"<li>{escape(str(opt))}</li>" for opt in options) + "</ul>"
+    else:
+        # If there's no options list, leave a blank line to write on
+        options_html = "<p>__________</p>"
+    return LIST_QUESTION.substitute(number=number, chapter=escape(chapter),
+                                    question=escape(question), options=options_html)
+
+
+def _mc_blanks_layout(questions, subject):
+    """
+    Up to 20 questions of two different types:
+    1. Multiple choice (10 questions) - options displayed horizontally
+    2. Fill in the blanks (10 questions)
+    """
+    mc_count = min(MC_BLANKS_SECTION, len(questions))
+    mc_questions = questions[:mc_count]
+    blank_questions = questions[mc_count:mc_count + MC_BLANKS_SECTION]
+
+    parts = [f"<h2 class='worksheet-title'>Worksheet - {escape(subject)}</h2>",
+             "<p>Please complete all questions in each section.</p>"]
+    if mc_questions:
+        parts.append("<hr><h3>Section 1: Choose the correct option</h3>")
+        parts.extend(_mc_fragment(i, *_fragment_key(q)) for i, q in enumerate(mc_questions, start=1))
+    if blank_questions:
+        parts.append("<hr><h3>Section 2: Fill in the blanks</h3>")
+        parts.extend(_blank_fragment(i, *_fragment_key(q)) for i, q in enumerate(blank_questions, start=1))
+    parts.append("<hr>")
+    return parts
+
+
+def _list_layout(questions, subject):
+    """Every question numbered in turn with its options as a bulleted list."""
+    parts = [f"<h2>Worksheet - {escape(subject)}</h2>",
+             "<p>Please answer the following questions:</p>"]
+    parts.extend(_list_fragment(i, *_fragment_key(q)) for i, q in enumerate(questions, start=1))
+    parts.append("<hr>")
+    return parts
+
+
+# layout name -> function(questions, subject) returning a list of HTML parts
+LAYOUTS = {
+    "mc_blanks": _mc_blanks_layout,
+    "list": _list_layout,
+}
+# layout name -> most questions it shows, for layouts that leave the rest out
+LAYOUT_CAPACITY = {
+    "mc_blanks": 2 * MC_BLANKS_SECTION,
+}
+
+
+def register_layout(name, layout, capacity=None):
+    LAYOUTS[name] = layout
+    if capacity is None:
+        LAYOUT_CAPACITY.pop(name, None)
+    else:
+        LAYOUT_CAPACITY[name] = capacity
+
+
+def render_worksheet(questions, subject, layout="mc_blanks", include_style=True):
+    """
+    Builds the HTML for a printable worksheet (does not show correct answers).
+    Question text and options are HTML-escaped.
+    """
+    parts = LAYOUTS[layout](questions, subject)
+    if include_style:
+        parts.append(WORKSHEET_STYLE)
+    return "\n".join(parts)
+
+
+def generate_worksheet_html(questions, subject):
+    return render_worksheet(questions, subject, layout="mc_blanks")
+
+
+class WorksheetSpec:
+    """
+    Everything that determines a worksheet. Equal specs over the same bank
+    always produce the same questions, worksheet and answer key.
+
+    Questions are either listed explicitly (hand-picked) or drawn from the
+    chosen chapters (all if empty) with an RNG seeded from seed, student and
+    subject, the same derivation plan_worksheets uses for class batches.
+    """
+
+    def __init__(self, subject, layout="mc_blanks", seed="0", chapters=None,
+                 count=WORKSHEET_QUESTIONS, student="", question_ids=None):
+        self.subject = subject
+        self.layout = layout
+        self.seed = str(seed)
+        self.chapters = tuple(sorted(chapters)) if chapters else ()
+        self.count = count
+        self.student = student
+        self.question_ids = tuple(question_ids) if question_ids else ()
+
+    def as_dict(self):
+        return {"subject": self.subject, "layout": self.layout, "seed": self.seed,
+                "chapters": list(self.chapters), "count": self.count, "student": self.student,
+                "question_ids": list(self.question_ids)}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**d)
+
+    @property
+    def id(self):
+        """Short stable ID for sharing and reprinting."""
+        canonical = json.dumps(self.as_dict(), sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:12]
+
+    @property
+    def title(self):
+        return f"{self.subject} - {self.student}" if self.student else self.subject
+
+    def __eq__(self, other):
+        return isinstance(other, WorksheetSpec) and self.as_dict() == other.as_dict()
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def pick_questions(self, bank):
+        """Question ids for this worksheet, in order, no more than its layout shows."""
+        capacity = LAYOUT_CAPACITY.get(self.layout)
+        if self.question_ids:
+            return [qid for qid in self.question_ids if qid in bank.by_id][:capacity]
+        pool = [q['id'] for q in bank.questions if not self.chapters or q.get('chapter') in self.chapters]
+        rng = random.Random(f"{self.seed}:{self.student}:{self.subject}")
+        return rng.sample(pool, min(self.count, capacity or self.count, len(pool)))
+
+
+class WorksheetJob:
+    """One student's worksheet for one subject: which questions, in which order."""
+
+    def __init__(self, student, subject, bank_path, question_ids, layout="mc_blanks", spec=None):
+        self.student = student
+        self.subject = subject
+        self.bank_path = bank_path
+        self.question_ids = question_ids
+        self.layout = layout
+        self.spec = spec
+
+
+class BatchResult:
+    def __init__(self, worksheets_html, answer_key_html, count, seconds):
+        self.worksheets_html = worksheets_html
+        self.answer_key_html = answer_key_html
+        self.count = count
+        self.seconds = seconds
+
+
+def plan_worksheets(roster, subjects, chapters=None, seed=0, count=WORKSHEET_QUESTIONS, layout="mc_blanks"):
+    """
+    Pick questions for every (student, subject) pair. Each pair gets its own
+    RNG derived from the seed, so students get different worksheets and the
+    same arguments always produce the same plan.
+    """
+    jobs = []
+    for subject in subjects:
+        bank_path = question_bank.subject_file(subject)
+        bank = question_bank.get_bank(bank_path)
+        if bank is None:
+            raise FileNotFoundError(f"Expected file '{bank_path}' not found.")
+        for student in roster:
+            spec = WorksheetSpec(subject, layout=layout, seed=seed, chapters=chapters,
+                                 count=count, student=student)
+            jobs.append(WorksheetJob(student, subject, bank_path, spec.pick_questions(bank), layout, spec))
+    return jobs
+
+
+def _answer_key_rows(questions, layout):
+    if layout != "mc_blanks":
+        return [(f"Q{i}", q.get("answer", "")) for i, q in enumerate(questions, start=1)]
+    # Mirrors the mc_blanks numbering: two sections of up to MC_BLANKS_SECTION
+    rows = []
+    for i, q in enumerate(questions):
+        section, number = (1, i + 1) if i < MC_BLANKS_SECTION else (2, i + 1 - MC_BLANKS_SECTION)
+        rows.append((f"S{section} Q{number}", q.get("answer", "")))
+    return rows
+
+
+def render_job(job):
+    """Render one worksheet and its answer key. Runs inside a pool worker."""
+    bank = question_bank.get_bank(job.bank_path)
+    questions = [bank.by_id[qid] for qid in job.question_ids]
+    title = f"{job.subject} - {job.student}" if job.student else job.subject
+    worksheet = render_worksheet(questions, title, layout=job.layout, include_style=False)
+    key_rows = "".join(
+        f"<tr><td>{label}</td><td>{escape(str(answer))}</td></tr>"
+        for label, answer in _answer_key_rows(questions, job.layout)
+    )
+    answer_key = (f"<h3>{escape(title)}</h3>"
+                  f"<table class='answer-key'>{key_rows}</table>")
+    return worksheet, answer_key
+
+
+def _cached_render(job, cache):
+    """(worksheet, answer key) from the cache, or None."""
+    entry = cache.get(job.spec.id, question_bank.bank_version(job.bank_path))
+    return (entry["worksheet"], entry["answer_key"]) if entry is not None else None
+
+
+def _store_render(job, rendered, cache):
+    cache.save_spec(job.spec.id, job.spec.as_dict())
+    cache.put(job.spec.id, question_bank.bank_version(job.bank_path),
+              {"question_ids": list(job.question_ids), "worksheet": rendered[0], "answer_key": rendered[1]})
+
+
+def render_spec(spec, cache=None):
+    """
+    (worksheet html, answer key html, question ids) for a spec, from the
+    on-disk cache when possible. Returns None if the subject has no bank.
+    """
+    bank_path = question_bank.subject_file(spec.subject)
+    bank = question_bank.get_bank(bank_path)
+    if bank is None:
+        return None
+    cache = cache or worksheet_cache.get_cache()
+    entry = cache.get(spec.id, question_bank.bank_version(bank_path))
+    if entry is not None:
+        return entry["worksheet"], entry["answer_key"], entry["question_ids"]
+    job = WorksheetJob(spec.student, spec.subject, bank_path, spec.pick_questions(bank), spec.layout, spec)
+    rendered = render_job(job)
+    _store_render(job, rendered, cache)
+    return rendered[0], rendered[1], job.question_ids
+
+
+def spec_for_id(worksheet_id, cache=None):
+    """The WorksheetSpec behind a shared worksheet ID, or None if it isn't known."""
+    spec_dict = (cache or worksheet_cache.get_cache()).load_spec(worksheet_id.strip())
+    return WorksheetSpec.from_dict(spec_dict) if spec_dict is not None else None
+
+
+# (spec id, bank version) -> (preview page, answer key page), least recently used first
+_previews = OrderedDict()
+_previews_lock = threading.Lock()
+
+
+def render_preview(spec):
+    """
+    (preview page with a print button, answer key page) for a spec, or None
+    if the subject has no bank. Kept in memory per (spec ID, bank version) on
+    top of the disk cache, so reruns that only redraw the preview don't touch
+    the disk, and editing the subject file invalidates both without the cache
+    holding on to old banks.
+    """
+    bank_path = question_bank.subject_file(spec.subject)
+    try:
+        key = (spec.id, question_bank.bank_version(bank_path))
+    except FileNotFoundError:
+        return None
+    with _previews_lock:
+        pages = _previews.get(key)
+        if pages is not None:
+            _previews.move_to_end(key)
+            return pages
+    rendered = render_spec(spec)
+    if rendered is None:
+        return None
+    pages = (PREVIEW_PAGE.substitute(worksheet=rendered[0] + WORKSHEET_STYLE),
+             _answer_key_page(spec, rendered[1]))
+    with _previews_lock:
+        _previews[key] = pages
+        while len(_previews) > MAX_CACHED_PREVIEWS:
+            _previews.popitem(last=False)
+    return pages
+
+
+def render_preview_page(spec):
+    """Full preview page with a print button, or None if the subject has no bank."""
+    pages = render_preview(spec)
+    return pages[0] if pages is not None else None
+
+
+BATCH_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+    body {{ font-family: Arial, sans-serif; padding: 20px; }}
+    .sheet + .sheet {{ page-break-before: always; }}
+    .answer-key td {{ padding: 2px 12px; border-bottom: 1px solid #ddd; }}
+</style>
+</head>
+<body>
+{body}
+</body>
+</html>
+"""
+
+
+def build_class_worksheets(roster, subjects, chapters=None, seed=0,
+                           count=WORKSHEET_QUESTIONS, workers=None, layout="mc_blanks"):
+    """
+    Plan and render a worksheet per student per subject across a process pool.
+    Worksheets already in the worksheet cache are not rendered again.
+    """
+    started = time.perf_counter()
+    jobs = plan_worksheets(roster, subjects, chapters=chapters, seed=seed, count=count, layout=layout)
+    cache = worksheet_cache.get_cache()
+    rendered = [_cached_render(job, cache) for job in jobs]
+    misses = [job for job, done in zip(jobs, rendered) if done is None]
+    if workers == 1 or len(misses) <= 1:
+        fresh = [render_job(job) for job in misses]
+    else:
+        # Imported here so the app's cold start doesn't pay for them
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        # spawn rather than fork: the Streamlit server process is multi-threaded
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+            fresh = list(pool.map(render_job, misses, chunksize=max(1, len(misses) // 16)))
+    fresh = iter(fresh)
+    for i, job in enumerate(jobs):
+        if rendered[i] is None:
+            rendered[i] = next(fresh)
+            _store_render(job, rendered[i], cache)
+
+    sheets = "\n".join(f"<section class='sheet'>{w}</section>" for w, _ in rendered)
+    keys = "\n".join(k for _, k in rendered)
+    worksheets_html = BATCH_PAGE.format(title="Class worksheets", body=sheets + WORKSHEET_STYLE)
+    answer_key_html = BATCH_PAGE.format(
+        title="Answer key",
+        body=f"<h2>Answer key (seed {escape(str(seed))})</h2>\n{keys}")
+    return BatchResult(worksheets_html, answer_key_html, len(jobs), time.perf_counter() - started)
+
+
+def build_worksheet(spec):
+    """A single worksheet and its answer key as a BatchResult, so it can be written like a batch."""
+    started = time.perf_counter()
+    rendered = render_spec(spec)
+    if rendered is None:
+        raise FileNotFoundError(f"Expected file '{question_bank.subject_file(spec.subject)}' not found.")
+    worksheet, answer_key, _ = rendered
+    return BatchResult(
+        BATCH_PAGE.format(title=f"Worksheet {spec.id}", body=worksheet + WORKSHEET_STYLE),
+        _answer_key_page(spec, answer_key), 1, time.perf_counter() - started)
+
+
+def _answer_key_page(spec, answer_key):
+    return BATCH_PAGE.format(title=f"Answer key {spec.id}",
+                             body=f"<h2>Answer key (worksheet {spec.id})</h2>\n{answer_key}")
+
+
+def write_batch(result, out_dir, pdf=False):
+    """Write worksheets.html and answer_key.html (and PDFs if asked). Returns the paths."""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for name, content in (("worksheets", result.worksheets_html), ("answer_key", result.answer_key_html)):
+        path = os.path.join(out_dir, f"{name}.html")
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        paths.append(path)
+        if pdf:
+            paths.append(html_to_pdf(content, os.path.join(out_dir, f"{name}.pdf")))
+    return paths
+
+
+def html_to_pdf(content, path):
+    try:
+        from weasyprint import HTML
+    except ImportError:
+        raise RuntimeError("PDF export needs WeasyPrint: pip install weasyprint")
+    HTML(string=content).write_pdf(path)
+    return path
+
+
+# Background runner so the tutor screen can kick off a batch and keep rendering
+_background = None
+
+
+def submit_in_background(*args, **kwargs):
+    """Run build_class_worksheets off the Streamlit script thread. Returns a Future."""
+    global _background
+    if _background is None:
+        from concurrent.futures import ThreadPoolExecutor
+        _background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="worksheets")
+    return _background.submit(build_class_worksheets, *args, **kwargs)
+
+
+def default_roster():
+    import storage
+    return [u['username'] for u in storage.get_user_store().load_users()
+            if u.get('role', 'student').lower() != 'tutor']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate one worksheet per student per subject")
+    parser.add_argument("--subjects", nargs="+")
+    parser.add_argument("--id", help="Reprint a single worksheet by its ID instead")
+    parser.add_argument("--roster", nargs="+", help="Student names (default: all students)")
+    parser.add_argument("--chapters", nargs="+", help="Only use questions from these chapters")
+    parser.add_argument("--seed", default="0")
+    parser.add_argument("--count", type=int, default=WORKSHEET_QUESTIONS,
+                        help="Questions per worksheet (mc_blanks shows at most 20)")
+    parser.add_argument("--layout", choices=sorted(LAYOUTS), default="mc_blanks")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--out", default="./worksheets")
+    parser.add_argument("--pdf", action="store_true", help="Also write PDFs (needs WeasyPrint)")
+    args = parser.parse_args()
+
+    if args.id:
+        spec = spec_for_id(args.id)
+        if spec is None:
+            parser.error(f"unknown worksheet ID '{args.id}'")
+        result = build_worksheet(spec)
+        for path in write_batch(result, args.out, pdf=args.pdf):
+            print(path)
+        return
+    if not args.subjects:
+        parser.error("--subjects is required unless --id is given")
+
+    roster = args.roster or default_roster()
+    result = build_class_worksheets(roster, args.subjects, chapters=args.chapters, seed=args.seed,
+                                    count=args.count, workers=args.workers, layout=args.layout)
+    for path in write_batch(result, args.out, pdf=args.pdf):
+        print(path)
+    print(f"{result.count} worksheets in {result.seconds:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
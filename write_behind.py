@@ -0,0 +1,255 @@
+"""
+Write-behind persistence for scores and progress.
+
+DataContext.flush() hands each rerun's score increments and attempts to a
+WriteBehind instead of writing them itself, so submitting an answer doesn't
+wait on the disk. A background thread writes everything queued every
+FLUSH_INTERVAL seconds, coalescing it first: all pending score increments go
+to the user store in one write, and each user's attempts are appended to
+their progress log with one write and one fsync.
+
+Reads stay consistent: DataContext overlays whatever is still queued (or
+being written) on top of what it loads, so a student sees their own answers
+on the very next rerun. The stores call back around the step that makes a
+write visible (the os.replace, append or COMMIT). The generation counter
+is made odd just before that step and even again right after it, when the
+written entries leave the overlay; the step itself runs without the
+in-memory lock, so submitting an answer never waits on the disk. A read
+that sees the counter change while it loads retries, so it never counts a
+write both on disk and in the overlay. A read that starts during that step
+waits for it to finish (one rename, append or COMMIT), never for a whole
+flush unless it had to retry MAX_READ_RETRIES times.
+
+Durability:
+
+- An answer is durable once the background flush that picks it up has
+  finished, normally within FLUSH_INTERVAL seconds of being submitted.
+- A clean shutdown (Ctrl-C, SIGTERM handled by Streamlit, interpreter exit)
+  writes everything still queued from an atexit hook.
+- A hard crash or power loss loses at most the last FLUSH_INTERVAL seconds
+  of answers. Nothing already written is affected; the progress log and
+  user store are still written atomically.
+- If more than MAX_PENDING updates pile up (a slow or stuck disk), the
+  submitting rerun writes the whole queue itself before returning, so the
+  backlog and the amount that can be lost stay bounded.
+- A failed background write is logged and retried on the next interval.
+- The queue is per process. Other server processes see these writes once
+  they are flushed.
+
+Set AVANI_WRITE_BEHIND=0 to write synchronously at the end of each rerun
+instead.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import instrumentation
+import progress_log
+
+FLUSH_INTERVAL = 0.5
+MAX_PENDING = 1000
+# Reads retried this often because writes kept landing mid-load then wait for the flush instead
+MAX_READ_RETRIES = 3
+
+log = logging.getLogger(__name__)
+
+
+class WriteBehind:
+    def __init__(self, store, progress_store=progress_log, analytics=None,
+                 interval=FLUSH_INTERVAL, max_pending=MAX_PENDING):
+        self.store = store
+        self.progress_store = progress_store
+        self.analytics = analytics
+        self.interval = interval
+        self.max_pending = max_pending
+        self._lock = threading.Lock()        # guards the queued and in-flight updates; never held for disk I/O
+        self._visible = threading.Condition(self._lock)  # notified when a write's visibility step ends
+        self._flush_lock = threading.Lock()  # one flush at a time
+        self._generation = 0                 # odd while a write is becoming visible
+        self._scores = {}                    # (username, subject) -> delta
+        self._attempts = {}                  # username -> [attempt kwargs]
+        self._inflight_scores = {}
+        self._inflight_attempts = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _pending_count(self):
+        return len(self._scores) + sum(len(batch) for batch in self._attempts.values())
+
+    def submit(self, scores, attempts):
+        """
+        Queue a rerun's score deltas ({(username, subject): delta}) and attempts
+        (record_attempt kwargs). Returns False if the queue was full and
+        everything was written synchronously instead.
+        """
+        with self._lock:
+            for key, delta in scores.items():
+                self._scores[key] = self._scores.get(key, 0) + delta
+            for attempt in attempts:
+                # Stamp the answer time now, not when the write happens
+                attempt.setdefault("ts", time.time())
+                self._attempts.setdefault(attempt["username"], []).append(attempt)
+            full = self._pending_count() > self.max_pending
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread.start()
+        if full:
+            instrumentation.count("write_behind_sync_flush")
+            self.flush()
+            return False
+        return True
+
+    def flush(self):
+        """Write everything queued so far. On failure the unwritten part is requeued and the error re-raised."""
+        with self._flush_lock:
+            with self._lock:
+                scores, self._scores = self._scores, {}
+                attempts, self._attempts = self._attempts, {}
+                self._inflight_scores = scores
+                self._inflight_attempts = dict(attempts)
+            if not (scores or attempts):
+                return
+            try:
+                with instrumentation.timer("write_behind_flush"):
+                    if scores:
+                        self._write_scores(scores)
+                    for username, batch in attempts.items():
+                        self.progress_store.record_attempts(
+                            username, [{k: v for k, v in a.items() if k != "username"} for a in batch],
+                            commit=self._retiring(lambda: self._inflight_attempts.pop(username, None)))
+                        self._record_analytics(batch)
+            except BaseException:
+                self._requeue()
+                raise
+
+    def _retiring(self, retire):
+        """
+        Context manager factory for the stores' `commit` hooks. The generation
+        is odd for as long as the store's visibility step runs; once it returns,
+        retire() drops the written entries from the overlay and the generation
+        turns even again. If the step fails nothing is retired and the entries
+        are requeued with the rest of the flush.
+        """
+        @contextmanager
+        def commit():
+            with self._lock:
+                self._generation += 1
+            try:
+                yield
+            except BaseException:
+                with self._lock:
+                    self._generation += 1
+                    self._visible.notify_all()
+                raise
+            with self._lock:
+                retire()
+                self._generation += 1
+                self._visible.notify_all()
+        return commit
+
+    def _write_scores(self, scores):
+        def retire():
+            self._inflight_scores = {}
+
+        if hasattr(self.store, "increment_scores"):
+            self.store.increment_scores(scores, commit=self._retiring(retire))
+        else:
+            # No commit hook: readers racing these writes may briefly see an increment twice
+            for (username, subject), delta in scores.items():
+                self.store.increment_score(username, subject, delta)
+            with self._retiring(retire)():
+                pass
+
+    def _record_analytics(self, batch):
+        if self.analytics is None:
+            return
+        # The attempts are already durable; a failure here only costs analytics rows
+        try:
+            for attempt in batch:
+                self.analytics.record_answer(**attempt)
+        except Exception:
+            log.exception("Could not update analytics")
+
+    def _requeue(self):
+        with self._lock:
+            for key, delta in self._inflight_scores.items():
+                self._scores[key] = self._scores.get(key, 0) + delta
+            for username, batch in self._inflight_attempts.items():
+                self._attempts[username] = batch + self._attempts.get(username, [])
+            self._inflight_scores = {}
+            self._inflight_attempts = {}
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                log.exception("Write-behind flush failed; will retry")
+
+    def close(self):
+        """Stop the background thread and write whatever is left."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def _read(self, load, overlay):
+        """
+        Return (load(), overlay()) such that the overlay holds exactly the
+        writes load() didn't see. load() runs without any lock, once no write
+        is becoming visible; if one started meanwhile it is retried, and after
+        MAX_READ_RETRIES it runs with flushes held off instead.
+        """
+        for _ in range(MAX_READ_RETRIES):
+            with self._lock:
+                while self._generation % 2:
+                    self._visible.wait()
+                generation = self._generation
+            result = load()
+            with self._lock:
+                if self._generation == generation:
+                    return result, overlay()
+            instrumentation.count("write_behind_read_retry")
+        with self._flush_lock:
+            result = load()
+            with self._lock:
+                return result, overlay()
+
+    def read_scores(self, load):
+        """
+        Call load() to read from the user store and return (result, deltas),
+        where deltas are the score increments not yet reflected in it.
+        """
+        def overlay():
+            deltas = dict(self._inflight_scores)
+            for key, delta in self._scores.items():
+                deltas[key] = deltas.get(key, 0) + delta
+            return deltas
+
+        return self._read(load, overlay)
+
+    def read_progress(self, username, load):
+        """Call load() to read a user's progress and return (progress, attempts not yet in it)."""
+        return self._read(load, lambda: self._inflight_attempts.get(username, []) + self._attempts.get(username, []))
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer(store, analytics=None):
+    """
+    Return the process-wide WriteBehind for `store`, or None if
+    AVANI_WRITE_BEHIND=0. It is flushed when the interpreter exits.
+    """
+    global _writer
+    if os.environ.get("AVANI_WRITE_BEHIND", "1") == "0":
+        return None
+    with _writer_lock:
+        if _writer is None:
+            _writer = WriteBehind(store, analytics=analytics)
+            atexit.register(_writer.close)
+        return _writer